@@ -0,0 +1,183 @@
+"""負荷試験用のDiscordとRSSサーバーの代役
+
+どちらもローカルだけで完結するので、ネットワークのないCIでも動く。
+"""
+import asyncio
+import hashlib
+import itertools
+import random
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from aiohttp import web
+
+_message_ids = itertools.count(10**18)
+
+
+class FakeRSSServer:
+    """遅延・エラー・304 を設定できるローカルのRSSサーバー
+
+    `/feeds/<key>` で feeds[key] の内容を返す。
+    """
+
+    def __init__(self, feeds, latency=0.05, jitter=0.02, error_rate=0.0, etag=True, seed=0):
+        self.feeds = feeds  # {key: bytes}
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.etag = etag
+        self.requests = 0
+        self.responses = {200: 0, 304: 0, 500: 0}
+        self._rng = random.Random(seed)
+        self._runner = None
+        self.port = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/feeds/{key}', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def url(self, key):
+        return f'http://127.0.0.1:{self.port}/feeds/{key}'
+
+    async def _handle(self, request):
+        self.requests += 1
+        await asyncio.sleep(max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter)))
+
+        if self._rng.random() < self.error_rate:
+            self.responses[500] += 1
+            return web.Response(status=500)
+
+        body = self.feeds[request.match_info['key']]
+        headers = {'Content-Type': 'application/rss+xml; charset=utf-8'}
+        if self.etag:
+            tag = '"' + hashlib.md5(body).hexdigest() + '"'
+            headers['ETag'] = tag
+            if request.headers.get('If-None-Match') == tag:
+                self.responses[304] += 1
+                return web.Response(status=304, headers=headers)
+        self.responses[200] += 1
+        return web.Response(body=body, headers=headers)
+
+
+class FakeUser:
+    def __init__(self, user_id, name, bot=False):
+        self.id = user_id
+        self.name = name
+        self.display_name = name
+        self.bot = bot
+
+    def __eq__(self, other):
+        return isinstance(other, FakeUser) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __str__(self):
+        return self.name
+
+
+class FakeChannel:
+    """送信内容を記録するだけのチャンネル（送信には latency 秒かかる）"""
+
+    def __init__(self, channel_id, state, latency=0.02):
+        self.id = channel_id
+        self.latency = latency
+        self.sent = []
+        self.edits = []
+        self._state = state
+
+    async def send(self, content=None, *, file=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        message = FakeMessage(self._state, self, None, content or '')
+        self.sent.append((time.perf_counter(), content, file))
+        return message
+
+    async def fetch_message(self, message_id):
+        # REST API の往復を模す
+        await asyncio.sleep(self.latency)
+        return FakeMessage(self._state, self, None, 'fetched message', message_id=message_id)
+
+
+class FakeMessage:
+    """discord.Message のうちBotが使う属性だけを持つ"""
+
+    def __init__(self, state, channel, author, content, guild=None, message_id=None, created_at=None):
+        self._state = state
+        self.id = message_id if message_id is not None else next(_message_ids)
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.guild = guild
+        self.created_at = created_at or datetime.now(timezone.utc)
+        self.attachments = []
+        self.pinned = False
+
+    async def edit(self, *, content=None, attachments=None, **kwargs):
+        await asyncio.sleep(self.channel.latency)
+        self.content = content if content is not None else self.content
+        self.attachments = list(attachments or [])
+        self.channel.edits.append((time.perf_counter(), self.id, content))
+        return self
+
+    async def pin(self, **kwargs):
+        self.pinned = True
+
+    async def unpin(self, **kwargs):
+        self.pinned = False
+
+
+class _FakeResponse:
+    def __init__(self, interaction):
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def send_message(self, content=None, **kwargs):
+        await asyncio.sleep(self._interaction.latency)
+        self._done = True
+        self._interaction.sent.append((content, kwargs))
+
+    async def defer(self, **kwargs):
+        self._done = True
+
+
+class _FakeFollowup:
+    def __init__(self, interaction):
+        self._interaction = interaction
+
+    async def send(self, content=None, **kwargs):
+        await asyncio.sleep(self._interaction.latency)
+        self._interaction.sent.append((content, kwargs))
+
+
+class FakeInteraction:
+    """スラッシュコマンドの呼び出し（応答は sent に記録する）"""
+
+    def __init__(self, guild_id, channel, user, latency=0.02):
+        self.guild = SimpleNamespace(id=guild_id)
+        self.guild_id = guild_id
+        self.channel = channel
+        self.user = user
+        self.latency = latency
+        self.sent = []
+        self.response = _FakeResponse(self)
+        self.followup = _FakeFollowup(self)
+
+
+def reaction_payload(user_id, guild_id, channel_id, message_id, emoji='👍'):
+    """on_raw_reaction_add に渡すペイロード"""
+    return SimpleNamespace(
+        user_id=user_id, guild_id=guild_id, channel_id=channel_id, message_id=message_id, emoji=emoji
+    )
@@ -0,0 +1,370 @@
+"""オフラインの負荷試験・リプレイ
+
+Discordにもインターネットにも接続せずに、メッセージが殺到したときの両Botの
+振る舞いを計測する。RSSはローカルの代役サーバー（遅延・エラー・304 を設定可能）、
+Discordのメッセージ・チャンネル・インタラクションは bench/fakes.py の代役を使う。
+
+イベント列は生成するか、記録済みのJSONL（1行1イベント）を再生する。
+イベントは --rate 件/秒で on_message / on_raw_reaction_add / スラッシュコマンドに
+流し込み、スループット・ハンドラの p50/p99 レイテンシ・送信数・最大メモリを
+JSONで出力する。
+
+    python3 bench/load.py --events 2000 --rate 200
+    python3 bench/load.py --record events.jsonl --events 500
+    python3 bench/load.py --replay events.jsonl --rss-error-rate 0.2
+    python3 bench/load.py --events 200 --export-debounce 0   # 定期出力（sends.obsidian のノート出力は1回になる）
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+_work_dir = tempfile.TemporaryDirectory(prefix='bot_load_')
+
+# Botを読み込む前に、外部に影響する設定をローカル向けに上書きする
+os.environ['METRICS_ENABLED'] = '0'
+os.environ['SEEN_INDEX_PATH'] = os.path.join(_work_dir.name, 'seen.sqlite3')
+os.environ['OBSIDIAN_STORE_PATH'] = os.path.join(_work_dir.name, 'obsidian.sqlite3')
+
+sys.path.insert(0, BENCH_DIR)
+
+import micro  # noqa: E402  (リポジトリ直下を sys.path に追加する)
+from fakes import (  # noqa: E402
+    FakeChannel, FakeInteraction, FakeMessage, FakeRSSServer, FakeUser, reaction_payload,
+)
+
+import news_bot  # noqa: E402
+import obsidian_bot  # noqa: E402
+from bot_base import SharedBot  # noqa: E402
+from bot_logging import setup_logging  # noqa: E402
+from outbound import LANE_NAMES, SEND_TOTAL  # noqa: E402
+
+FEED_ITEMS = 200
+
+# 生成するイベントの内訳（重み）
+EVENT_MIX = {
+    ('news', 'message'): 55,
+    ('news', 'reaction'): 15,
+    ('news', 'command'): 5,
+    ('obsidian', 'message'): 20,
+    ('obsidian', 'command'): 5,
+}
+NEWS_COMMANDS = ('news_help', 'news_status', 'news_digest')
+OBSIDIAN_COMMANDS = ('obsidian_status', 'list_notes', 'download_note')
+# ニュースBotの監視対象外の一般チャンネル
+GENERAL_CHANNEL_IDS = (1400000000000000001, 1400000000000000002, 1400000000000000003)
+TRIGGER_RATE = 0.05
+# ニュースBotは設定ファイルの最初のギルドとして動かす
+NEWS_GUILD = next(iter(news_bot.GUILD_CONFIGS.values()))
+
+
+# ---------------------------------------------------------------- イベント列
+
+def generate_events(count, rate, seed=0):
+    """count 件のイベント列を生成（t は開始からの秒数）"""
+    rng = random.Random(seed)
+    kinds = list(EVENT_MIX)
+    weights = list(EVENT_MIX.values())
+    authors = list(range(1, 51))
+    keywords = NEWS_GUILD.keywords
+    news_message_ids = []
+    events = []
+
+    for i in range(count):
+        bot_name, event_type = rng.choices(kinds, weights)[0]
+        event = {'t': round(i / rate, 6), 'bot': bot_name, 'type': event_type,
+                 'author': rng.choice(authors)}
+
+        if event_type == 'message':
+            content = ' '.join(rng.choice(micro.WORDS) for _ in range(rng.choice((3, 8, 20))))
+            if bot_name == 'news':
+                channel_id = rng.choice((NEWS_GUILD.echo_channel_id,) + GENERAL_CHANNEL_IDS)
+                if keywords and rng.random() < TRIGGER_RATE:
+                    content = f'{rng.choice(keywords)} {content}'
+            else:
+                channel_id = obsidian_bot.OBSIDIAN_CHANNEL_ID
+            event.update(channel_id=channel_id, content=content, message_id=10**17 + i)
+            if bot_name == 'news':
+                news_message_ids.append((channel_id, event['message_id']))
+
+        elif event_type == 'reaction':
+            if news_message_ids and rng.random() < 0.8:
+                # 最近のメッセージへのリアクション（大半はキャッシュに当たる）
+                channel_id, message_id = rng.choice(news_message_ids[-200:])
+            else:
+                channel_id, message_id = rng.choice(GENERAL_CHANNEL_IDS), 10**16 + i
+            event.update(channel_id=channel_id, message_id=message_id)
+
+        else:
+            if bot_name == 'news':
+                event.update(command=rng.choice(NEWS_COMMANDS), channel_id=NEWS_GUILD.news_channel_id)
+            else:
+                event.update(command=rng.choice(OBSIDIAN_COMMANDS),
+                             channel_id=obsidian_bot.OBSIDIAN_CHANNEL_ID)
+                if event['command'] == 'download_note':
+                    event['args'] = {'date': None}
+        events.append(event)
+    return events
+
+
+def load_events(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_events(path, events):
+    with open(path, 'w', encoding='utf-8') as f:
+        for event in events:
+            f.write(json.dumps(event, ensure_ascii=False) + '\n')
+
+
+# ---------------------------------------------------------------- Botの準備
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+
+
+class FakeDiscord:
+    """1つの SharedBot に両機能の Cog を載せ、Discordの代わりに代役を使う"""
+
+    def __init__(self, bot, send_latency):
+        self.bot = bot
+        self.send_latency = send_latency
+        self.cogs = {}
+        self.guild_ids = {'news': NEWS_GUILD.guild_id, 'obsidian': obsidian_bot.ALLOWED_GUILD_ID}
+        self.channels = {}
+        self.channel_features = {}  # {channel_id: イベントの機能名}
+        self.interactions = {name: [] for name in self.guild_ids}
+        self._users = {}
+
+        # Discordへの接続の代わりに、Bot自身のユーザーとチャンネルの取得だけ差し替える
+        bot._connection.user = FakeUser(900, 'load-bot', bot=True)
+        bot.get_channel = self.channel
+
+    async def start(self):
+        await self.bot.http_client.start()
+        self.cogs['news'] = news_bot.NewsCog(self.bot)
+        self.cogs['obsidian'] = obsidian_bot.ObsidianCog(self.bot)
+        for cog in self.cogs.values():
+            await self.bot.add_cog(cog)
+
+    async def stop(self):
+        for cog in self.cogs.values():
+            await self.bot.remove_cog(cog.qualified_name)
+        # 終了時に積まれた送信（未出力のノートなど）を送り切る
+        await self.bot.outbound.close()
+        await self.bot.http_client.close()
+
+    def channel(self, channel_id):
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            channel = self.channels[channel_id] = FakeChannel(
+                channel_id, self.bot._connection, self.send_latency
+            )
+        return channel
+
+    def user(self, user_id):
+        user = self._users.get(user_id)
+        if user is None:
+            user = self._users[user_id] = FakeUser(user_id, micro.AUTHORS[user_id % len(micro.AUTHORS)])
+        return user
+
+    def dispatch(self, event):
+        """イベントを処理するコルーチンを返す"""
+        feature = event['bot']
+        cog = self.cogs[feature]
+        guild_id = self.guild_ids[feature]
+        self.channel_features.setdefault(event['channel_id'], feature)
+
+        if event['type'] == 'message':
+            message = FakeMessage(
+                self.bot._connection, self.channel(event['channel_id']), self.user(event['author']),
+                event['content'], guild=FakeGuild(guild_id), message_id=event['message_id'],
+            )
+            return cog.on_message(message)
+
+        if event['type'] == 'reaction':
+            payload = reaction_payload(event['author'], guild_id, event['channel_id'], event['message_id'])
+            return cog.on_raw_reaction_add(payload)
+
+        if event['type'] == 'command':
+            interaction = FakeInteraction(
+                guild_id, self.channel(event['channel_id']), self.user(event['author']), self.send_latency
+            )
+            self.interactions[feature].append(interaction)
+            command = self.bot.tree.get_command(event['command'])
+            return command.callback(command.binding, interaction, **event.get('args', {}))
+
+        raise ValueError(f'未知のイベント: {event["type"]}')
+
+    def sends(self, feature):
+        channels = [
+            channel for channel_id, channel in self.channels.items()
+            if self.channel_features.get(channel_id) == feature
+        ]
+        return {
+            'channel_messages': sum(len(channel.sent) for channel in channels),
+            'channel_edits': sum(len(channel.edits) for channel in channels),
+            'interaction_responses': sum(len(interaction.sent) for interaction in self.interactions[feature]),
+        }
+
+
+def point_news_sources_at(rss):
+    """RSSの取得先を代役サーバーに向ける"""
+    for key, source in list(news_bot.NEWS_SOURCES.items()):
+        news_bot.NEWS_SOURCES[key] = source._replace(url=rss.url(key))
+
+
+# ---------------------------------------------------------------- 実行・集計
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def latency_summary(values):
+    return {
+        'count': len(values),
+        'p50_ms': percentile(values, 0.50) * 1000,
+        'p99_ms': percentile(values, 0.99) * 1000,
+        'max_ms': max(values, default=0.0) * 1000,
+    }
+
+
+async def replay(events, discord_stub, speed):
+    """イベントを記録された時刻どおりに（speed 倍速で）処理させる"""
+    latencies = {}
+    errors = {}
+    loop = asyncio.get_running_loop()
+
+    async def handle(event):
+        key = f'{event["bot"]}.{event.get("command") or event["type"]}'
+        start = time.perf_counter()
+        try:
+            await discord_stub.dispatch(event)
+        except Exception:
+            errors[key] = errors.get(key, 0) + 1
+        latencies.setdefault(key, []).append(time.perf_counter() - start)
+
+    started = loop.time()
+    tasks = []
+    for event in events:
+        delay = started + event['t'] / speed - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(handle(event)))
+    await asyncio.gather(*tasks)
+    handled = loop.time() - started
+
+    # 送信キューに残った分を送り切るまで
+    await discord_stub.bot.outbound.close()
+    drained = loop.time() - started
+    return latencies, errors, handled, drained
+
+
+async def run(args, events):
+    feeds = {key: micro.build_feed(key, FEED_ITEMS) for key in news_bot.NEWS_SOURCES}
+    rss = FakeRSSServer(
+        feeds, latency=args.rss_latency, jitter=args.rss_latency / 2,
+        error_rate=args.rss_error_rate, etag=not args.no_etag, seed=args.seed,
+    )
+    await rss.start()
+
+    point_news_sources_at(rss)
+    if args.export_debounce is not None:
+        obsidian_bot.EXPORT_POLICY = obsidian_bot.EXPORT_POLICY._replace(debounce=args.export_debounce)
+    # 単一プロセス構成（bot_main.py）と同じく、1つのBotに両機能を載せる
+    discord_stub = FakeDiscord(SharedBot(), args.send_latency)
+    await discord_stub.start()
+    try:
+        latencies, errors, handled, drained = await replay(events, discord_stub, args.speed)
+    finally:
+        await discord_stub.stop()
+        await rss.close()
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        'events': len(events),
+        'duration_s': handled,
+        'drain_s': drained,
+        'throughput_eps': len(events) / handled if handled else 0.0,
+        'latency': {
+            'all': latency_summary(all_latencies),
+            **{key: latency_summary(values) for key, values in sorted(latencies.items())},
+        },
+        'errors': errors,
+        'sends': {
+            'by_lane': {
+                lane: {result: SEND_TOTAL.value(lane=lane, result=result) for result in ('ok', 'error')}
+                for lane in LANE_NAMES.values()
+            },
+            **{feature: discord_stub.sends(feature) for feature in discord_stub.cogs},
+        },
+        'rss': {'requests': rss.requests, 'responses': rss.responses},
+        # Linux では KiB 単位、macOS ではバイト単位
+        'peak_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // (1024 if sys.platform == 'darwin' else 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=1000, help='生成するイベント数')
+    parser.add_argument('--rate', type=float, default=100.0, help='生成するイベントの頻度（件/秒）')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--replay', help='再生するイベント列のJSONL')
+    parser.add_argument('--record', help='生成したイベント列をJSONLに保存して終了')
+    parser.add_argument('--speed', type=float, default=1.0, help='再生速度の倍率')
+    parser.add_argument('--rss-latency', type=float, default=0.05, help='RSSサーバーの応答遅延（秒）')
+    parser.add_argument('--rss-error-rate', type=float, default=0.0, help='RSSサーバーが500を返す割合')
+    parser.add_argument('--no-etag', action='store_true', help='RSSサーバーでETag/304を使わない')
+    parser.add_argument('--send-latency', type=float, default=0.02, help='Discordへの送信1回の遅延（秒）')
+    parser.add_argument('--export-debounce', type=float,
+                        help='ノート自動出力の debounce（秒）。省略時は OBSIDIAN_EXPORT_DEBOUNCE')
+    parser.add_argument('--output', help='結果のJSONを書き出すファイル（省略時は標準出力）')
+    args = parser.parse_args()
+
+    if args.replay:
+        events = load_events(args.replay)
+    else:
+        events = generate_events(args.events, args.rate, args.seed)
+    if args.record:
+        save_events(args.record, events)
+        return
+
+    # 結果のJSONと混ざらないよう、既定ではエラーだけを出力する
+    setup_logging(level=os.getenv('LOG_LEVEL', 'ERROR'))
+    results = asyncio.run(run(args, events))
+    report = {
+        'meta': {
+            'commit': micro.git_revision(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'source': args.replay or f'generated(seed={args.seed}, rate={args.rate})',
+            'speed': args.speed,
+            'rss_latency_s': args.rss_latency,
+            'rss_error_rate': args.rss_error_rate,
+            'rss_etag': not args.no_etag,
+            'send_latency_s': args.send_latency,
+        },
+        'results': results,
+    }
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+"""オフラインのマイクロベンチマーク
+
+ネットワークやDiscordのトークンなしで、次の処理の所要時間を計測する。
+
+- news_bot.py: 記録済みのRSS（NHK / Yahoo! / Google News と Shift_JIS の地域ニュース）を件数を変えて
+  ストリーム解析し、投稿用に整形するまで
+- obsidian_bot.py: 100 / 1万 / 10万件のメッセージを持つ1日分について
+  add_message_to_memory / generate_markdown_bytes / sanitize_content と、
+  メモリに保持する1件あたりのバイト数
+
+結果はJSONで出力するので、コミット間で比較できる。
+
+    python3 bench/micro.py --output bench_results.json
+    python3 bench/micro.py --compare bench_results.json
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+sys.path.insert(0, ROOT)
+
+import news_bot  # noqa: E402
+import obsidian_bot  # noqa: E402
+from bot_base import LRUCache  # noqa: E402
+from message_store import MessageStore  # noqa: E402
+
+FEED_SOURCES = ('nhk', 'yahoo', 'google')
+# UTF-8 以外で配信されるフィードの記録（{フィクスチャ名: 文字コード}）
+ENCODED_FEEDS = {'local_sjis': 'shift_jis'}
+ENCODED_FEED_LIMIT = 50
+FEED_SIZES = (20, 200, 2000)
+MESSAGE_COUNTS = (100, 10_000, 100_000)
+BENCH_DATE = '2025-07-25'
+ITEM_RE = re.compile(r'<item>.*?</item>', re.S)
+
+AUTHORS = ['たろう', 'hanako', 'Suzuki Ichiro', 'ゆき', 'ken_dev', '山田', 'mika', 'ボブ']
+WORDS = ['今日', 'は', 'ミーティング', 'の', 'メモ', 'TODO', '[link]', '`code`', '確認', 'します',
+         'deploy', '完了', '資料', 'を', '共有', 'note', '明日', 'まで', 'に', '対応']
+
+
+# ---------------------------------------------------------------- 計測
+
+def measure(func, repeat):
+    """func を repeat 回実行して所要時間（秒）の統計を返す"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {
+        'runs': repeat,
+        'min_s': min(timings),
+        'median_s': statistics.median(timings),
+        'mean_s': statistics.fmean(timings),
+    }
+
+
+def peak_memory(func):
+    """func を1回実行したときのPythonヒープの最大使用量（KiB）"""
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1024
+
+
+# ---------------------------------------------------------------- フィード
+
+def build_feed(source_key, size, encoding='utf-8'):
+    """記録済みのフィードの記事を複製して size 件のフィードを作る（encoding のバイト列）"""
+    with open(os.path.join(FIXTURES_DIR, f'{source_key}.xml'), encoding=encoding) as f:
+        text = f.read()
+    items = ITEM_RE.findall(text)
+    head = text[:text.index(items[0])]
+    tail = text[text.rindex(items[-1]) + len(items[-1]):]
+
+    copies = []
+    for i in range(size):
+        item = items[i % len(items)]
+        # URLとタイトルを記事毎に変えて重複しないようにする
+        item = item.replace('</title>', f' ({i})</title>', 1)
+        item = item.replace('</link>', f'#{i}</link>', 1)
+        copies.append(item)
+    return (head + '\n'.join(copies) + tail).encode(encoding)
+
+
+def parse_and_render(data, limit, render_limit):
+    parser = news_bot.FeedParser(limit)
+    for offset in range(0, len(data), news_bot.FEED_CHUNK_SIZE):
+        if parser.feed(data[offset:offset + news_bot.FEED_CHUNK_SIZE]):
+            break
+    items = parser.close()
+    return news_bot.render_digest(items[:render_limit])
+
+
+def bench_feeds(results, repeat):
+    for source_key in FEED_SOURCES:
+        source = news_bot.NEWS_SOURCES[source_key]
+        limit = source.limit * news_bot.FEED_LOOKAHEAD_FACTOR
+        for size in FEED_SIZES:
+            data = build_feed(source_key, size)
+            params = {'source': source_key, 'items': size, 'bytes': len(data)}
+
+            # Botと同じ件数で打ち切る場合
+            result = measure(lambda: parse_and_render(data, limit, source.limit), repeat)
+            result['peak_kib'] = peak_memory(lambda: parse_and_render(data, limit, source.limit))
+            results[f'feed.digest[{source_key},{size}]'] = {**params, **result}
+
+            # 全件を解析する場合（フィードの大きさに比例する部分の目安）
+            result = measure(lambda: parse_and_render(data, size, source.limit), repeat)
+            result['peak_kib'] = peak_memory(lambda: parse_and_render(data, size, source.limit))
+            results[f'feed.parse_all[{source_key},{size}]'] = {**params, **result}
+
+    # expat が読めない文字コードは UTF-8 に変換しながら解析する
+    for name, encoding in ENCODED_FEEDS.items():
+        for size in FEED_SIZES:
+            data = build_feed(name, size, encoding)
+            params = {'source': name, 'encoding': encoding, 'items': size, 'bytes': len(data)}
+            result = measure(lambda: parse_and_render(data, size, ENCODED_FEED_LIMIT), repeat)
+            result['peak_kib'] = peak_memory(lambda: parse_and_render(data, size, ENCODED_FEED_LIMIT))
+            results[f'feed.parse_all[{name},{size}]'] = {**params, **result}
+
+
+# ---------------------------------------------------------------- Obsidian
+
+def synthetic_messages(count, seed=0):
+    """1日分の合成メッセージ（discord.Message の必要な属性だけを持つ）"""
+    rng = random.Random(seed)
+    start = datetime(2025, 7, 25, tzinfo=timezone(timedelta(hours=9))).astimezone(timezone.utc)
+    step = 86400 / count
+    messages = []
+    for i in range(count):
+        length = rng.choice((3, 8, 20, 60))
+        content = ' '.join(rng.choice(WORDS) for _ in range(length))
+        messages.append(SimpleNamespace(
+            id=10**17 + i,
+            created_at=start + timedelta(seconds=i * step),
+            author=SimpleNamespace(display_name=rng.choice(AUTHORS)),
+            content=content,
+        ))
+    return messages
+
+
+_store_dir = tempfile.TemporaryDirectory(prefix='bot_bench_')
+
+
+def reset_obsidian_state():
+    """空の保存先に差し替える（一時ディレクトリに作る）"""
+    obsidian_bot.message_store.close()
+    path = os.path.join(_store_dir.name, 'obsidian.sqlite3')
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    obsidian_bot.message_store = MessageStore(path, obsidian_bot.OBSIDIAN_RECENT_DAYS)
+    obsidian_bot.message_store.open()
+    obsidian_bot.note_cache = LRUCache(obsidian_bot.OBSIDIAN_RECENT_DAYS)
+
+
+def memory_per_message(messages):
+    """メモリに保持する1件あたりのバイト数（本文の文字列は含めない）
+
+    合成メッセージの本文は保存先と共有されるので、増えた分がレコード自体の大きさになる。
+    """
+    reset_obsidian_state()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        for message in messages:
+            obsidian_bot.add_message_to_memory(message)
+        obsidian_bot.message_store.flush()
+        gc.collect()
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return (after - before) / len(messages)
+
+
+def bench_obsidian(results, repeat):
+    for count in MESSAGE_COUNTS:
+        messages = synthetic_messages(count)
+        runs = repeat if count < 100_000 else max(1, repeat // 2)
+
+        def add_all():
+            reset_obsidian_state()
+            for message in messages:
+                obsidian_bot.add_message_to_memory(message)
+            obsidian_bot.message_store.flush()
+
+        result = measure(add_all, runs)
+        result['per_message_us'] = result['median_s'] / count * 1e6
+        results[f'obsidian.add_message_to_memory[{count}]'] = {'messages': count, **result}
+
+        add_all()
+        result = measure(lambda: obsidian_bot.generate_markdown_bytes(BENCH_DATE), runs)
+        results[f'obsidian.generate_markdown_bytes[{count}]'] = {'messages': count, **result}
+
+        result = {'per_message_bytes': memory_per_message(messages)}
+        results[f'obsidian.memory_per_message[{count}]'] = {'messages': count, **result}
+
+        contents = [message.content for message in messages]
+        result = measure(lambda: [obsidian_bot.sanitize_content(c) for c in contents], runs)
+        results[f'obsidian.sanitize_content[{count}]'] = {'messages': count, **result}
+
+        reset_obsidian_state()
+
+
+# ---------------------------------------------------------------- 出力
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous, current):
+    """前回の結果と比べた中央値の比（>1 なら遅くなった）を表示"""
+    print(f'{"benchmark":55} {"before":>10} {"after":>10} {"ratio":>7}', file=sys.stderr)
+    for name, result in current['results'].items():
+        before = previous['results'].get(name)
+        if before is None:
+            continue
+        ratio = result['median_s'] / before['median_s'] if before['median_s'] else float('inf')
+        mark = ' ⚠️' if ratio > 1.1 else ''
+        print(f'{name:55} {before["median_s"] * 1000:9.2f}ms {result["median_s"] * 1000:9.2f}ms '
+              f'{ratio:6.2f}x{mark}', file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', help='結果のJSONを書き出すファイル（省略時は標準出力）')
+    parser.add_argument('--compare', help='比較する前回の結果のJSON')
+    parser.add_argument('--repeat', type=int, default=5, help='各ベンチマークの繰り返し回数')
+    parser.add_argument('--only', choices=('feeds', 'obsidian'), help='一部だけ実行')
+    args = parser.parse_args()
+
+    results = {}
+    if args.only in (None, 'feeds'):
+        bench_feeds(results, args.repeat)
+    if args.only in (None, 'obsidian'):
+        bench_obsidian(results, args.repeat)
+
+    report = {
+        'meta': {
+            'commit': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
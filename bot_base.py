@@ -0,0 +1,132 @@
+"""Bot共通の土台
+
+ニュース・Obsidian の各機能は discord.py の Cog として実装し、このBotに載せる。
+1つのプロセス・1つのゲートウェイ接続で両方を動かす場合も、片方だけを
+動かす場合も同じクラスを使う。
+
+Botが持つ共有資源
+- http_client: 接続プール付きのHTTPクライアント
+- outbound: 送信キュー
+- metrics_server: `/metrics` のエンドポイント
+- message_cache: 最近のメッセージの先頭部分（リアクション通知などで引用）
+"""
+import asyncio
+import logging
+import signal
+from collections import OrderedDict
+
+import discord
+from discord.ext import commands
+
+from command_sync import sync_command_tree
+from http_client import HttpClient
+from metrics import MetricsServer
+from outbound import OutboundDispatcher
+
+logger = logging.getLogger(__name__)
+
+# 先頭部分を覚えておくメッセージ数
+MESSAGE_CACHE_SIZE = 2048
+
+
+def default_intents():
+    intents = discord.Intents.default()
+    intents.message_content = True
+    return intents
+
+
+class LRUCache:
+    """件数上限付きのLRUキャッシュ"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+
+    def get(self, key, default=None):
+        if key not in self._items:
+            return default
+        self._items.move_to_end(key)
+        return self._items[key]
+
+    def put(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def discard(self, key):
+        self._items.pop(key, None)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+
+class SharedBot(commands.AutoShardedBot):
+    """機能（Cog）を載せる共通のBot
+
+    cogs には Cog のクラス、extensions には `setup(bot)` を持つモジュール名を渡す。
+    extensions は setup_hook で初めて import されるので、使わない機能は読み込まれない。
+    """
+
+    def __init__(self, cogs=(), extensions=(), **kwargs):
+        kwargs.setdefault('command_prefix', '!')
+        kwargs.setdefault('intents', default_intents())
+        super().__init__(**kwargs)
+        self.initial_cogs = tuple(cogs)
+        self.initial_extensions = tuple(extensions)
+        self.http_client = HttpClient()
+        self.outbound = OutboundDispatcher()
+        self.metrics_server = MetricsServer()
+        self.message_cache = LRUCache(MESSAGE_CACHE_SIZE)  # {message_id: 先頭部分}
+        self._close_task = None
+
+    async def setup_hook(self):
+        # ゲートウェイ接続前に1回だけ呼ばれる（再接続時の on_ready では何もしない）
+        self._install_signal_handlers()
+        await self.http_client.start()
+        await self.metrics_server.start()
+        for cog_class in self.initial_cogs:
+            await self.add_cog(cog_class(self))
+        for extension in self.initial_extensions:
+            await self.load_extension(extension)
+        # 全機能のコマンドが揃ってから同期する
+        await sync_command_tree(self)
+
+    def _install_signal_handlers(self):
+        """SIGTERM / SIGINT で close() を呼ぶ
+
+        `Client.run` は KeyboardInterrupt しか扱わないため、コンテナの停止（SIGTERM）でも
+        各機能の終了処理（未保存・未出力の書き出し）と送信キューの送り切りを行うようにする。
+        """
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, self._request_close)
+            except (NotImplementedError, RuntimeError):
+                # Windows やメインスレッド以外のループでは登録できない
+                return
+
+    def _request_close(self):
+        if self._close_task is None:
+            logger.info('終了シグナルを受け取りました。終了処理を行います')
+            self._close_task = asyncio.create_task(self.close())
+
+    async def close(self):
+        # 各機能の終了処理 → 送信キューを空にする → 接続を閉じる、の順に行う
+        for extension in tuple(self.extensions):
+            try:
+                await self.unload_extension(extension)
+            except Exception:
+                logger.exception('%s の終了処理に失敗しました', extension)
+        for name in tuple(self.cogs):
+            try:
+                await self.remove_cog(name)
+            except Exception:
+                logger.exception('%s の終了処理に失敗しました', name)
+        await self.outbound.close()
+        await super().close()
+        await self.http_client.close()
+        await self.metrics_server.close()
@@ -0,0 +1,70 @@
+"""Bot共通のログ設定
+
+ログレコードはキューに積むだけで、標準出力への書き込みはバックグラウンドの
+スレッドが行う。イベントループがstdoutの書き込み待ちで止まらないようにするため。
+
+環境変数
+- LOG_LEVEL: ログレベル（既定 INFO）
+- LOG_QUIET: 1 なら本番向けの静かなモード（WARNING 以上のみ）
+- LOG_DEBUG_SAMPLE_RATE: DEBUG ログを出すイベントの割合（0.0〜1.0、既定 1.0）
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+
+LOG_FORMAT = '%(asctime)s %(levelname)-7s %(name)s: %(message)s'
+LOG_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_listener = None
+_debug_sample_rate = 1.0
+
+
+def setup_logging(level=None, quiet=None, debug_sample_rate=None):
+    """ルートロガーをキュー経由の非同期出力に設定（2回目以降は何もしない）"""
+    global _listener, _debug_sample_rate
+    if _listener is not None:
+        return
+
+    if quiet is None:
+        quiet = os.getenv('LOG_QUIET', '0') == '1'
+    if level is None:
+        level = 'WARNING' if quiet else os.getenv('LOG_LEVEL', 'INFO')
+    if debug_sample_rate is None:
+        debug_sample_rate = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', '1.0'))
+    _debug_sample_rate = debug_sample_rate
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """キューに残ったログを書き出してスレッドを止める"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def sample_event(logger):
+    """このイベントでDEBUGログを出すかどうか
+
+    1イベントにつき1回呼び、結果に応じてそのイベントのDEBUGログをまとめて出す。
+    DEBUG が無効なら常に False なので、メッセージの整形自体を省ける。
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return False
+    return _debug_sample_rate >= 1.0 or random.random() < _debug_sample_rate
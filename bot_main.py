@@ -0,0 +1,51 @@
+"""ニュースBotとObsidianBotを1つのプロセスで動かす
+
+有効にした機能だけを Cog として読み込み、1つのゲートウェイ接続・1つの
+discord.py キャッシュ・共有のHTTPクライアントと送信キューで動かす。
+
+環境変数
+- DISCORD_TOKEN: Botのトークン
+- BOT_FEATURES: 有効にする機能（カンマ区切り、既定 news,obsidian）
+"""
+import logging
+import os
+
+from dotenv import load_dotenv
+
+from bot_base import SharedBot
+from bot_logging import setup_logging
+
+load_dotenv('.env')
+
+logger = logging.getLogger('bot_main')
+
+# 機能名と拡張モジュール（有効にした機能のモジュールだけ import される）
+FEATURES = {
+    'news': 'news_bot',
+    'obsidian': 'obsidian_bot',
+}
+
+
+def enabled_extensions(value=None):
+    """BOT_FEATURES から読み込む拡張モジュールの一覧を作る"""
+    if value is None:
+        value = os.getenv('BOT_FEATURES', ','.join(FEATURES))
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in FEATURES]
+    if unknown:
+        raise ValueError(f'未知の機能です: {unknown}（使用できるのは {list(FEATURES)}）')
+    return [FEATURES[name] for name in dict.fromkeys(names)]
+
+
+if __name__ == '__main__':
+    setup_logging()
+    extensions = enabled_extensions()
+    token = os.getenv('DISCORD_TOKEN')
+    if not extensions:
+        logger.error('BOT_FEATURES で有効な機能がありません。')
+    elif token:
+        logger.info('有効な機能: %s', ', '.join(extensions))
+        # discord.py のログもキュー経由の共通設定で出力する
+        SharedBot(extensions=extensions).run(token, log_handler=None)
+    else:
+        logger.error('DISCORD_TOKENが設定されていません。.envファイルを確認してください。')
@@ -0,0 +1,82 @@
+"""スラッシュコマンドの同期（定義が変わったときだけ）
+
+`tree.sync()` はレート制限が厳しく時間もかかるため、起動のたびには呼ばない。
+コマンド定義のハッシュをアプリケーション毎にファイルへ記録し、前回と
+異なる場合だけ同期する。
+
+環境変数
+- COMMAND_SYNC_STATE_PATH: ハッシュを記録するファイル（既定 command_sync_state.json）
+- COMMAND_SYNC_FORCE: 1 なら定義が同じでも同期する
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+COMMAND_SYNC_STATE_PATH = os.getenv('COMMAND_SYNC_STATE_PATH', 'command_sync_state.json')
+COMMAND_SYNC_FORCE = os.getenv('COMMAND_SYNC_FORCE', '0') == '1'
+
+
+def command_tree_hash(tree):
+    """コマンド定義（名前・説明・引数）のハッシュ"""
+    definitions = sorted(
+        (command.to_dict() for command in tree.get_commands()), key=lambda d: (d['name'], d.get('type', 1))
+    )
+    data = json.dumps(definitions, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def _load_state(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning('コマンド同期の記録を読み込めませんでした (%s): %s', path, e)
+        return {}
+
+
+def _save_state(path, state):
+    # 両Botが同じファイルを使っても壊れないよう一時ファイルから置き換える
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.command_sync_')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, path)
+    except OSError:
+        os.unlink(tmp_path)
+        raise
+
+
+async def sync_command_tree(bot, path=COMMAND_SYNC_STATE_PATH, force=COMMAND_SYNC_FORCE):
+    """定義が前回の同期から変わっていればコマンドツリーを同期
+
+    同期した場合は True を返す。失敗してもBotの起動は止めない。
+    """
+    key = str(bot.application_id)
+    digest = command_tree_hash(bot.tree)
+    state = _load_state(path)
+    if not force and state.get(key) == digest:
+        logger.info('スラッシュコマンドに変更がないため同期を省略しました')
+        return False
+
+    try:
+        synced = await bot.tree.sync()
+    except Exception as e:
+        logger.error('スラッシュコマンドの同期に失敗しました: %s', e)
+        return False
+    logger.info('%d個のスラッシュコマンドを同期しました', len(synced))
+
+    # 同期の直前に他のプロセスが書き込んでいても上書きしないよう読み直す
+    state = _load_state(path)
+    state[key] = digest
+    try:
+        _save_state(path, state)
+    except OSError as e:
+        logger.warning('コマンド同期の記録を保存できませんでした (%s): %s', path, e)
+    return True
@@ -0,0 +1,117 @@
+"""Bot共通のHTTPクライアント
+
+Botの起動中ずっと使い回す aiohttp セッションを管理する。
+keep-alive の接続プール・DNSキャッシュ・ホスト毎の接続数上限・タイムアウト・
+バックオフ付きリトライをまとめて提供する。
+"""
+import asyncio
+import random
+from contextlib import asynccontextmanager
+
+import aiohttp
+
+# 接続プール設定
+HTTP_POOL_LIMIT = 50             # 全体の同時接続数
+HTTP_LIMIT_PER_HOST = 8          # ホスト毎の同時接続数
+HTTP_DNS_CACHE_TTL = 300         # DNSキャッシュの有効期間（秒）
+HTTP_KEEPALIVE_TIMEOUT = 60      # アイドル接続を保持する時間（秒）
+
+# タイムアウト設定（秒）
+HTTP_CONNECT_TIMEOUT = 5
+HTTP_READ_TIMEOUT = 15
+HTTP_TOTAL_TIMEOUT = 30
+
+# リトライ設定
+HTTP_MAX_RETRIES = 3
+HTTP_BACKOFF_BASE = 0.5          # 初回待機時間（秒）、以降は倍々
+HTTP_BACKOFF_MAX = 8.0
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+USER_AGENT = 'discord-news-bot/1.0 (+aiohttp)'
+
+
+class HttpClient:
+    """Botのライフタイムで共有するHTTPクライアント
+
+    `setup_hook` で `start()`、終了時に `close()` を呼ぶ。
+    """
+
+    def __init__(self, max_retries=HTTP_MAX_RETRIES):
+        self.max_retries = max_retries
+        self._session = None
+
+    async def start(self):
+        """接続プール付きのセッションを作成"""
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_LIMIT_PER_HOST,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=HTTP_TOTAL_TIMEOUT,
+            sock_connect=HTTP_CONNECT_TIMEOUT,
+            sock_read=HTTP_READ_TIMEOUT,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            headers={'User-Agent': USER_AGENT},
+        )
+
+    async def close(self):
+        """セッションと接続プールを閉じる"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            raise RuntimeError('HttpClientが開始されていません。start()を先に呼んでください。')
+        return self._session
+
+    @asynccontextmanager
+    async def get(self, url, headers=None):
+        """GETリクエストを送信（接続エラー・5xx・429はバックオフしてリトライ）
+
+        `async with client.get(url) as response:` の形で使う。
+        """
+        response = None
+        for attempt in range(self.max_retries + 1):
+            is_last = attempt == self.max_retries
+            try:
+                response = await self.session.get(url, headers=headers)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if is_last:
+                    raise
+                await asyncio.sleep(_backoff_delay(attempt))
+                continue
+
+            if response.status in RETRY_STATUSES and not is_last:
+                delay = _retry_after(response) or _backoff_delay(attempt)
+                response.release()
+                await asyncio.sleep(delay)
+                continue
+            break
+
+        try:
+            yield response
+        finally:
+            response.release()
+
+
+def _backoff_delay(attempt):
+    """指数バックオフ + ジッター"""
+    delay = min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt))
+    return delay * (0.5 + random.random() / 2)
+
+
+def _retry_after(response):
+    """Retry-Afterヘッダー（秒指定のみ）を解釈"""
+    value = response.headers.get('Retry-After')
+    if value and value.isdigit():
+        return min(HTTP_BACKOFF_MAX, float(value))
+    return None
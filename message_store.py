@@ -0,0 +1,427 @@
+"""ObsidianBotのメッセージ保存先
+
+収集したメッセージを SQLite（WAL）に永続化し、再起動やデプロイで失われないようにする。
+
+- 書き込みは一定件数・一定時間ごとにまとめてコミットする（fsync の回数を抑える）
+- メモリには直近の数日分だけを保持し、それより前の日は必要なときにDBから読む
+- 日付の一覧（昇順）と日毎の件数はメモリ上で更新し続けるので、
+  一覧表示や件数の取得でDB全体を数え直したり並べ替えたりしない
+- 本文は文字の2-gram（と1文字）に分けて FTS5 の転置インデックスにも書き込み、保存済みの全期間を
+  `search()` で検索できる（note_search.py）
+- 編集・削除はメッセージIDの索引（dict）で対象を直接引いて反映する。削除したものは
+  本文を None にした墓標として残し、その日を次に読むときにまとめて取り除く
+- メモリ上のメッセージは `StoredMessage`（__slots__、整数のUNIX時刻、投稿者名は
+  ストア内で共有）で持つ。本文とメッセージIDの整数を除いて1件あたり約150バイト
+  （`python3 bench/micro.py --only obsidian` の memory_per_message で計測できる。うち約50バイトはIDの索引）
+"""
+import bisect
+import logging
+import sqlite3
+import time
+
+from note_search import match_query, ngram_text
+
+logger = logging.getLogger(__name__)
+
+# メモリに保持する日数（新しい方から）
+RECENT_DAYS = 3
+
+# この件数が溜まるか、最初の未保存メッセージからこの秒数が経ったらコミットする
+FLUSH_BATCH_SIZE = 100
+FLUSH_INTERVAL = 2.0
+
+JST_OFFSET = 9 * 3600  # 日本時間（UTC+9）の秒数
+
+# 検索インデックスの作り方を変えたときに上げる（古いDBは open() でインデックスを作り直す）
+# 1: 2-gram  2: 1文字のトークンを追加
+MESSAGE_STORE_SCHEMA_VERSION = 2
+
+
+class StoredMessage:
+    """保存したメッセージ1件（timestamp は UTC の UNIX 時刻の秒、削除済みなら content は None）"""
+
+    __slots__ = ('message_id', 'timestamp', 'author', 'content')
+
+    def __init__(self, message_id, timestamp, author, content):
+        self.message_id = message_id
+        self.timestamp = timestamp
+        self.author = author
+        self.content = content
+
+    def __repr__(self):
+        return f'StoredMessage({self.message_id}, {self.timestamp}, {self.author!r}, {self.content!r})'
+
+
+def message_sort_key(message):
+    """1日の中での並び順（時刻、同じ秒ならID順）"""
+    return (message.timestamp, message.message_id)
+
+
+def _date_of(message):
+    """StoredMessage の日本時間の日付（YYYY-MM-DD）"""
+    return time.strftime('%Y-%m-%d', time.gmtime(message.timestamp + JST_OFFSET))
+
+
+class MessageStore:
+    """日付毎のメッセージの永続ストア
+
+    `open()` で接続し、終了時に `close()` を呼ぶ（未保存の分はそこで書き出す）。
+    メッセージは StoredMessage で扱う。
+    """
+
+    def __init__(self, path, recent_days=RECENT_DAYS, flush_batch_size=FLUSH_BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.recent_days = recent_days
+        self.flush_batch_size = flush_batch_size
+        self.flush_interval = flush_interval
+        self._conn = None
+        self._dates = []        # 昇順の日付一覧
+        self._counts = {}       # {date_str: 件数}
+        self._total = 0
+        self._recent = {}       # {date_str: [StoredMessage]} 直近 recent_days 日分
+        self._pending = {}      # 未保存の {message_id: (date_str, StoredMessage)}
+        self._authors = {}      # 投稿者名の共有テーブル（同じ名前の文字列を1つにする）
+        self._index = {}        # {message_id: StoredMessage} メモリに保持している日の分
+        self._tombstones = {}   # {date_str: 削除済みで一覧に残っている件数}
+        self._pending_edits = {}      # 未保存の編集 {message_id: content}
+        self._pending_deletes = set()  # 未保存の削除
+        self._pending_since = None
+        self._last_message_id = None
+
+    def open(self):
+        if self._conn is not None:
+            return
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        # コミット毎に fsync する（コミット自体をまとめて回数を減らす）
+        self._conn.execute('PRAGMA synchronous=FULL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS messages (
+                message_id INTEGER PRIMARY KEY,
+                date TEXT NOT NULL,
+                timestamp REAL NOT NULL,
+                author TEXT NOT NULL,
+                content TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_date ON messages (date, timestamp);
+            CREATE TABLE IF NOT EXISTS note_exports (
+                date TEXT PRIMARY KEY,
+                channel_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                name TEXT PRIMARY KEY,
+                message_id INTEGER NOT NULL
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (
+                grams, tokenize = 'unicode61 remove_diacritics 0'
+            );
+        ''')
+        version = self._conn.execute('PRAGMA user_version').fetchone()[0]
+        if version < MESSAGE_STORE_SCHEMA_VERSION:
+            self._rebuild_search_index()
+
+        self._counts = dict(self._conn.execute('SELECT date, COUNT(*) FROM messages GROUP BY date'))
+        self._dates = sorted(self._counts)
+        self._total = sum(self._counts.values())
+        self._last_message_id = self._conn.execute('SELECT MAX(message_id) FROM messages').fetchone()[0]
+        self._recent = {date_str: self._load(date_str) for date_str in self._dates[-self.recent_days:]}
+        self._index = {msg.message_id: msg for messages in self._recent.values() for msg in messages}
+        logger.info('📂 保存済みメッセージを読み込みました: %d 日 / %d 件', len(self._dates), self._total)
+
+    def close(self):
+        if self._conn is not None:
+            self.flush()
+            self._conn.close()
+            self._conn = None
+
+    def __contains__(self, message_id):
+        """メモリに保持している日か未保存の分に message_id があるか（古い日はDBを引かない）"""
+        return message_id in self._index or message_id in self._pending
+
+    def add(self, date_str, message_id, created_at, author, content):
+        """メッセージを追加して StoredMessage を返す
+
+        保存は flush_batch_size 件・flush_interval 秒毎にまとめて行う。
+        created_at は aware な datetime。同じメッセージが再送された場合（`in` で分かる）は
+        何も変えずに保持している StoredMessage を返す。
+        """
+        existing = self._index.get(message_id)
+        if existing is None and message_id in self._pending:
+            existing = self._pending[message_id][1]
+        if existing is not None:
+            return existing
+
+        message_data = StoredMessage(message_id, int(created_at.timestamp()), self._author(author), content)
+        if date_str not in self._counts:
+            self._counts[date_str] = 0
+            bisect.insort(self._dates, date_str)
+            if self._is_recent(date_str):
+                self._recent[date_str] = []
+                self._evict()
+        self._counts[date_str] += 1
+        self._total += 1
+
+        messages = self._recent.get(date_str)
+        if messages is not None:
+            if messages and message_sort_key(message_data) < message_sort_key(messages[-1]):
+                # 履歴の取り込みなどで古いメッセージが後から来た場合も時刻順に並べる
+                bisect.insort(messages, message_data, key=message_sort_key)
+            else:
+                messages.append(message_data)
+            self._index[message_id] = message_data
+        if self._last_message_id is None or message_id > self._last_message_id:
+            self._last_message_id = message_id
+
+        self._pending[message_id] = (date_str, message_data)
+        self._schedule_flush()
+        return message_data
+
+    def edit(self, message_id, content):
+        """メッセージの本文を更新し、その日付を返す
+
+        保存していないメッセージや、本文が変わっていない場合は None。
+        """
+        message_data = self._index.get(message_id)
+        if message_data is not None:
+            if message_data.content is None or message_data.content == content:
+                return None
+            message_data.content = content
+            date_str = _date_of(message_data)
+        else:
+            # メモリにない古い日はDBを主キーで引く
+            row = self._stored_row(message_id)
+            if row is None or row[1] == content:
+                return None
+            date_str = row[0]
+        self._pending_edits[message_id] = content
+        self._schedule_flush()
+        return date_str
+
+    def delete(self, message_id):
+        """メッセージを削除し、その日付を返す（保存していないメッセージなら None）"""
+        message_data = self._index.pop(message_id, None)
+        if message_data is not None:
+            if message_data.content is None:
+                return None
+            # 一覧からは取り除かず墓標にする（その日を次に読むときにまとめて取り除く）
+            message_data.content = None
+            date_str = _date_of(message_data)
+            self._tombstones[date_str] = self._tombstones.get(date_str, 0) + 1
+        else:
+            date_str = self._stored_date(message_id)
+            if date_str is None:
+                return None
+        self._pending_edits.pop(message_id, None)
+        self._pending_deletes.add(message_id)
+        self._counts[date_str] -= 1
+        self._total -= 1
+        if not self._counts[date_str]:
+            del self._counts[date_str]
+            self._dates.remove(date_str)
+            self._recent.pop(date_str, None)
+            self._tombstones.pop(date_str, None)
+        self._schedule_flush()
+        return date_str
+
+    def _schedule_flush(self):
+        if self._pending_since is None:
+            self._pending_since = time.monotonic()
+        pending = len(self._pending) + len(self._pending_edits) + len(self._pending_deletes)
+        if (pending >= self.flush_batch_size
+                or time.monotonic() - self._pending_since >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """未保存のメッセージ・編集・削除を1回のコミットで書き出す"""
+        if not (self._pending or self._pending_edits or self._pending_deletes):
+            return
+        # 保存前に削除されたものは書かない（編集は StoredMessage に反映済み）。
+        # _pending はIDをキーにしているので、検索インデックスに同じIDを2回追加することはない
+        rows = [
+            (data.message_id, date_str, data.timestamp, data.author, data.content)
+            for date_str, data in self._pending.values()
+            if data.content is not None
+        ]
+        edits = list(self._pending_edits.items())
+        deletes = [(message_id,) for message_id in self._pending_deletes]
+        with self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO messages (message_id, date, timestamp, author, content) '
+                'VALUES (?, ?, ?, ?, ?)',
+                rows,
+            )
+            # 以前の書き出しで保存済みのIDが再送されても検索結果が重複しないよう置き換える
+            self._conn.executemany('DELETE FROM messages_fts WHERE rowid = ?', [(row[0],) for row in rows])
+            self._conn.executemany(
+                'INSERT INTO messages_fts (rowid, grams) VALUES (?, ?)',
+                [(row[0], ngram_text(row[4])) for row in rows],
+            )
+            if edits:
+                self._conn.executemany('UPDATE messages SET content = ? WHERE message_id = ?',
+                                       [(content, message_id) for message_id, content in edits])
+                self._conn.executemany('UPDATE messages_fts SET grams = ? WHERE rowid = ?',
+                                       [(ngram_text(content), message_id) for message_id, content in edits])
+            if deletes:
+                self._conn.executemany('DELETE FROM messages WHERE message_id = ?', deletes)
+                self._conn.executemany('DELETE FROM messages_fts WHERE rowid = ?', deletes)
+        self._pending.clear()
+        self._pending_edits.clear()
+        self._pending_deletes.clear()
+        self._pending_since = None
+
+    def messages(self, date_str):
+        """指定日のメッセージ（古い日はDBから読む）"""
+        messages = self._recent.get(date_str)
+        if messages is not None:
+            if self._tombstones.pop(date_str, 0):
+                messages[:] = [msg for msg in messages if msg.content is not None]
+            return messages
+        if date_str not in self._counts:
+            return []
+        self.flush()
+        return self._load(date_str)
+
+    def search(self, query, author=None, start=None, end=None, limit=10):
+        """本文に query を含むメッセージを関連度順に返す [(date_str, StoredMessage)]
+
+        author は投稿者名の部分一致、start / end は 'YYYY-MM-DD'（両端を含む）。
+        """
+        expression = match_query(query)
+        if expression is None:
+            return []
+        self.flush()
+        conditions = ['messages_fts MATCH ?']
+        params = [expression]
+        if author:
+            conditions.append('instr(lower(m.author), ?) > 0')
+            params.append(author.lower())
+        if start:
+            conditions.append('m.date >= ?')
+            params.append(start)
+        if end:
+            conditions.append('m.date <= ?')
+            params.append(end)
+        rows = self._conn.execute(
+            'SELECT m.message_id, m.date, m.timestamp, m.author, m.content '
+            'FROM messages_fts JOIN messages AS m ON m.message_id = messages_fts.rowid '
+            f'WHERE {" AND ".join(conditions)} '
+            'ORDER BY bm25(messages_fts), m.timestamp DESC LIMIT ?',
+            (*params, limit),
+        )
+        return [
+            (date_str, StoredMessage(message_id, int(timestamp), self._author(author), content))
+            for message_id, date_str, timestamp, author, content in rows
+        ]
+
+    def dates(self, limit=None):
+        """メッセージのある日付の一覧（新しい順、limit 件まで）"""
+        if limit is None:
+            return self._dates[::-1]
+        return self._dates[:-limit - 1:-1]
+
+    def export_message(self, date_str):
+        """指定日のノートを載せた（編集して更新する）メッセージの (channel_id, message_id)"""
+        return self._conn.execute(
+            'SELECT channel_id, message_id FROM note_exports WHERE date = ?', (date_str,)
+        ).fetchone()
+
+    def set_export_message(self, date_str, channel_id, message_id):
+        with self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO note_exports (date, channel_id, message_id) VALUES (?, ?, ?)',
+                (date_str, channel_id, message_id),
+            )
+
+    def known_ids(self, message_ids):
+        """message_ids のうち保存済みのもの"""
+        message_ids = list(message_ids)
+        if not message_ids:
+            return set()
+        self.flush()
+        placeholders = ','.join('?' * len(message_ids))
+        rows = self._conn.execute(
+            f'SELECT message_id FROM messages WHERE message_id IN ({placeholders})', message_ids
+        )
+        return {message_id for message_id, in rows}
+
+    def checkpoint(self, name):
+        """name で記録したメッセージID（なければ None）"""
+        row = self._conn.execute('SELECT message_id FROM checkpoints WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_checkpoint(self, name, message_id):
+        with self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO checkpoints (name, message_id) VALUES (?, ?)', (name, message_id)
+            )
+
+    @property
+    def last_message_id(self):
+        """保存した中で最新（最大）のメッセージID"""
+        return self._last_message_id
+
+    def count(self, date_str):
+        return self._counts.get(date_str, 0)
+
+    @property
+    def day_count(self):
+        return len(self._dates)
+
+    @property
+    def total(self):
+        return self._total
+
+    @property
+    def cached_count(self):
+        """メモリに保持しているメッセージ数"""
+        return len(self._index)
+
+    def _rebuild_search_index(self):
+        """検索インデックスを保存済みの全メッセージから作り直す"""
+        with self._conn:
+            self._conn.execute('DELETE FROM messages_fts')
+            rows = self._conn.execute('SELECT message_id, content FROM messages')
+            self._conn.executemany(
+                'INSERT INTO messages_fts (rowid, grams) VALUES (?, ?)',
+                ((message_id, ngram_text(content)) for message_id, content in rows.fetchall()),
+            )
+            self._conn.execute(f'PRAGMA user_version = {MESSAGE_STORE_SCHEMA_VERSION}')
+        logger.info('🔎 検索インデックスを作成しました')
+
+    def _author(self, name):
+        return self._authors.setdefault(name, name)
+
+    def _is_recent(self, date_str):
+        # 日付一覧の新しい方から recent_days 日以内か
+        return date_str in self._dates[-self.recent_days:]
+
+    def _evict(self):
+        """直近 recent_days 日より前の日をメモリから外す（DBには残る）"""
+        keep = set(self._dates[-self.recent_days:])
+        for date_str in [d for d in self._recent if d not in keep]:
+            for msg in self._recent.pop(date_str):
+                self._index.pop(msg.message_id, None)
+            self._tombstones.pop(date_str, None)
+
+    def _stored_row(self, message_id):
+        """メモリにないメッセージの (日付, 本文) をDBから引く（未保存の分も含める）"""
+        self.flush()
+        return self._conn.execute(
+            'SELECT date, content FROM messages WHERE message_id = ?', (message_id,)
+        ).fetchone()
+
+    def _stored_date(self, message_id):
+        row = self._stored_row(message_id)
+        return row[0] if row else None
+
+    def _load(self, date_str):
+        rows = self._conn.execute(
+            'SELECT message_id, timestamp, author, content FROM messages WHERE date = ? ORDER BY timestamp, message_id',
+            (date_str,),
+        )
+        return [
+            StoredMessage(message_id, int(timestamp), self._author(author), content)
+            for message_id, timestamp, author, content in rows
+        ]
@@ -0,0 +1,300 @@
+"""Bot共通のメトリクス
+
+カウンター・ゲージ・ヒストグラムを保持し、Prometheus のテキスト形式で
+`/metrics` に公開する。イベントループの遅延を測るプローブもここにある。
+
+環境変数
+- METRICS_ENABLED: 0 ならHTTPエンドポイントを起動しない（既定 1）
+- METRICS_HOST / METRICS_PORT: 待ち受けアドレス（既定 127.0.0.1:8000。同じホストからだけ取得できる。
+  他のホストやコンテナの外から取得する場合だけ 0.0.0.0 などを指定する）
+"""
+import asyncio
+import functools
+import logging
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '8000'))
+
+# 既定のヒストグラムの境界（秒）
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# イベントループ遅延の計測間隔（秒）
+LOOP_LAG_INTERVAL = 0.5
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    inner = ','.join(f'{name}="{_escape(value)}"' for name, value in pairs)
+    return '{' + inner + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Counter:
+    """単調増加するカウンター"""
+
+    type_name = 'counter'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+    def render(self):
+        for key, value in self._values.items():
+            yield f'{self.name}{_format_labels(key)} {value}'
+
+
+class Gauge:
+    """現在値を表すゲージ（関数を渡せば出力時に値を取得する）"""
+
+    type_name = 'gauge'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._functions = {}
+
+    def set(self, value, **labels):
+        self._values[_label_key(labels)] = value
+
+    def set_function(self, function, **labels):
+        self._functions[_label_key(labels)] = function
+
+    def value(self, **labels):
+        key = _label_key(labels)
+        if key in self._functions:
+            return self._functions[key]()
+        return self._values.get(key, 0)
+
+    def render(self):
+        for key, value in self._values.items():
+            yield f'{self.name}{_format_labels(key)} {value}'
+        for key, function in self._functions.items():
+            yield f'{self.name}{_format_labels(key)} {function()}'
+
+
+class _HistogramSeries:
+    __slots__ = ('bucket_counts', 'count', 'sum', 'max')
+
+    def __init__(self, bucket_count):
+        self.bucket_counts = [0] * bucket_count
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+
+class Histogram:
+    """値の分布を記録するヒストグラム"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = _HistogramSeries(len(self.buckets) + 1)
+        series.bucket_counts[bisect_left(self.buckets, value)] += 1
+        series.count += 1
+        series.sum += value
+        series.max = max(series.max, value)
+
+    @contextmanager
+    def time(self, **labels):
+        """with ブロックの所要時間を記録"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def summary(self, **labels):
+        """(件数, 平均, 最大) を返す。ラベル省略時は全系列の合計"""
+        if labels:
+            key = _label_key(labels)
+            series = [self._series[key]] if key in self._series else []
+        else:
+            series = list(self._series.values())
+        count = sum(s.count for s in series)
+        total = sum(s.sum for s in series)
+        peak = max((s.max for s in series), default=0.0)
+        return count, (total / count if count else 0.0), peak
+
+    def render(self):
+        for key, series in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, series.bucket_counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket{_format_labels(key, [("le", bound)])} {cumulative}'
+            yield f'{self.name}_bucket{_format_labels(key, [("le", "+Inf")])} {series.count}'
+            yield f'{self.name}_sum{_format_labels(key)} {series.sum}'
+            yield f'{self.name}_count{_format_labels(key)} {series.count}'
+
+
+class Registry:
+    """メトリクスの登録先（同じ名前なら同じインスタンスを返す）"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _get_or_create(self, cls, name, help_text, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, help_text, **kwargs)
+        return metric
+
+    def counter(self, name, help_text):
+        return self._get_or_create(Counter, name, help_text)
+
+    def gauge(self, name, help_text):
+        return self._get_or_create(Gauge, name, help_text)
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help_text, buckets=buckets)
+
+    def render(self):
+        """Prometheus のテキスト形式で出力"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.help_text}')
+            lines.append(f'# TYPE {metric.name} {metric.type_name}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# 両Bot共通のメトリクス
+HANDLER_DURATION = REGISTRY.histogram(
+    'bot_handler_duration_seconds', 'イベント処理・スラッシュコマンドの所要時間'
+)
+HANDLER_ERRORS = REGISTRY.counter('bot_handler_errors_total', 'イベント処理で発生した例外の数')
+LOOP_LAG = REGISTRY.histogram(
+    'bot_event_loop_lag_seconds', 'イベントループの遅延',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+
+def timed(handler):
+    """非同期関数・通常の関数の所要時間を HANDLER_DURATION に記録するデコレーター
+
+    スラッシュコマンドにも使える（引数の情報は functools.wraps で引き継ぐ）。
+    """
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                except Exception:
+                    HANDLER_ERRORS.inc(handler=handler)
+                    raise
+                finally:
+                    HANDLER_DURATION.observe(time.perf_counter() - start, handler=handler)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                HANDLER_ERRORS.inc(handler=handler)
+                raise
+            finally:
+                HANDLER_DURATION.observe(time.perf_counter() - start, handler=handler)
+        return wrapper
+
+    return decorator
+
+
+class MetricsServer:
+    """`/metrics` を公開するHTTPサーバーとイベントループ遅延のプローブ"""
+
+    def __init__(self, registry=REGISTRY, host=METRICS_HOST, port=METRICS_PORT):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._runner = None
+        self._probe = None
+
+    async def start(self):
+        if self._probe is None:
+            self._probe = asyncio.create_task(self._measure_loop_lag())
+        if not METRICS_ENABLED or self._runner is not None:
+            return
+
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self.host, self.port).start()
+        except OSError as e:
+            # ポートが使えなくてもBot本体は動かし続ける
+            logger.error('メトリクスサーバーを起動できませんでした (%s:%s): %s', self.host, self.port, e)
+            await self._runner.cleanup()
+            self._runner = None
+            return
+        logger.info('📈 メトリクスを公開しました: http://%s:%s/metrics', self.host, self.port)
+
+    async def close(self):
+        if self._probe is not None:
+            self._probe.cancel()
+            self._probe = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle_metrics(self, request):
+        return web.Response(text=self.registry.render(), content_type='text/plain', charset='utf-8')
+
+    async def _measure_loop_lag(self):
+        """一定間隔で sleep し、予定より遅れて起きた分をループの遅延として記録"""
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + LOOP_LAG_INTERVAL
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            LOOP_LAG.observe(max(0.0, loop.time() - expected))
+
+
+def format_summary():
+    """ステータス表示用の要約（処理時間とループ遅延）"""
+    count, mean, peak = HANDLER_DURATION.summary()
+    _, lag_mean, lag_peak = LOOP_LAG.summary()
+    return (
+        f"処理: {count} 回 / 平均 {mean * 1000:.1f}ms / 最大 {peak * 1000:.1f}ms\n"
+        f"ループ遅延: 平均 {lag_mean * 1000:.1f}ms / 最大 {lag_peak * 1000:.1f}ms"
+    )
@@ -1,339 +1,1024 @@
+import asyncio
+import codecs
+import logging
+import random
+import time as time_module
 import discord
 from discord.ext import commands, tasks
 from discord import app_commands
 import os
 from dotenv import load_dotenv
 from datetime import time, datetime, timezone, timedelta
-import aiohttp
 import xml.etree.ElementTree as ET
 import re
+import html
+import json
+from typing import NamedTuple, Optional
+
+from bot_base import LRUCache, SharedBot
+from bot_logging import sample_event, setup_logging
+from metrics import REGISTRY, format_summary, timed
+from outbound import PRIORITY_CHATTER, PRIORITY_DIGEST, PRIORITY_REPLY, split_message
+from seen_index import DEFAULT_SCOPE, SeenIndex
 
 load_dotenv('.env.news')
 
-intents = discord.Intents.default()
-intents.message_content = True
+logger = logging.getLogger('news_bot')
+
+# ニュースソース定義ファイル
+NEWS_SOURCES_PATH = os.getenv(
+    'NEWS_SOURCES_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'news_sources.json'),
+)
+
+# フィードキャッシュの有効期間（秒）
+FEED_CACHE_TTL = int(os.getenv('FEED_CACHE_TTL', '300'))
+
+# ギルド毎の設定ファイル（配信・エコーチャンネル、配信スケジュール、ソース、トリガーのキーワード）
+NEWS_GUILDS_PATH = os.getenv(
+    'NEWS_GUILDS_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'news_guilds.json'),
+)
+
+# ニューストリガーの設定
+DEFAULT_NEWS_KEYWORDS = ('ニュース', 'news', '最新', 'ニュース教えて', 'ニュースある？')
+NEWS_TRIGGER_COOLDOWN = float(os.getenv('NEWS_TRIGGER_COOLDOWN', '60'))  # チャンネル毎（秒）
+NEWS_TRIGGER_CACHE_SIZE = 1024    # クールダウンを覚えておくチャンネル数
+NEWS_TRIGGER_MAX_LENGTH = int(os.getenv('NEWS_TRIGGER_MAX_LENGTH', '200'))  # これより長い投稿は対象外
+
+# リアクション応答の設定
+REACTION_NOTICE_CACHE_SIZE = 2048  # 通知した時刻を覚えておくメッセージ数
+SNIPPET_LENGTH = 50               # 引用する文字数
+REACTION_COALESCE_WINDOW = 60.0   # 同じメッセージへの👍通知をまとめる時間（秒）
 
-bot = commands.Bot(command_prefix='!', intents=intents)
+# 定期配信の時間帯毎のソース（ALL_SOURCES_KEY なら全ソースのまとめ）
+ALL_SOURCES_KEY = 'all'
+DEFAULT_NEWS_SCHEDULE = {'morning': 'nhk', 'lunch': 'yahoo', 'evening': 'google'}
+SLOT_HOURS = {'morning': 6, 'lunch': 12, 'evening': 18}
 
-# 設定
-ALLOWED_GUILD_ID = 1397720381149806723
-GREETING_CHANNEL_ID = 1398171685613469746
-ECHO_CHANNEL_ID = 1397720382236135446  # エコー機能を使用するチャンネル
+# バックグラウンド更新間隔に加えるゆらぎ（間隔に対する割合）
+FEED_REFRESH_JITTER = 0.1
 
-# RSS URL
-NHK_RSS_URL = 'https://www.nhk.or.jp/rss/news/cat0.xml'
-YAHOO_RSS_URL = 'https://news.yahoo.co.jp/rss/topics/top-picks.xml'
-GOOGLE_NEWS_URL = 'https://news.google.com/rss?hl=ja&gl=JP&ceid=JP:ja'
+# 表示件数に対して解析する記事数の倍率
+FEED_LOOKAHEAD_FACTOR = 3
+
+# ストリーム解析で一度に読み込むバイト数
+FEED_CHUNK_SIZE = 8192
+
+# 配信済み記事インデックス
+SEEN_INDEX_PATH = os.getenv('SEEN_INDEX_PATH', 'news_seen.sqlite3')
+SEEN_INDEX_MAX_AGE_DAYS = int(os.getenv('SEEN_INDEX_MAX_AGE_DAYS', '7'))
 
 # 日本時間のタイムゾーン
 JST = timezone(timedelta(hours=9))
 
+# 記事要素として扱うタグ（RSS 2.0 / RSS 1.0 の item、Atom の entry）
+FEED_ITEM_TAGS = frozenset({'item', 'entry'})
+FEED_SUMMARY_TAGS = ('description', 'summary', 'content')
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+WHITESPACE_RE = re.compile(r'\s+')
+# XML宣言の encoding（先頭の BOM を含めてよい）
+XML_ENCODING_RE = re.compile(r'^(?:\ufeff|\xef\xbb\xbf)?<\?xml[^>]*?\bencoding\s*=\s*["\']([A-Za-z0-9._-]+)["\']')
+# XML宣言を探すために先頭から溜める最大バイト数
+XML_PROLOG_MAX_BYTES = 1024
+# expat が自分で読める文字コード（それ以外は UTF-8 に変換してから渡す）
+EXPAT_ENCODINGS = frozenset({'utf-8', 'utf-16', 'utf-16-le', 'utf-16-be', 'iso8859-1', 'ascii'})
+# Python の codecs にない文字コード名の別名
+ENCODING_ALIASES = {'windows-31j': 'cp932'}
 
-async def fetch_nhk_news():
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(NHK_RSS_URL) as response:
-                if response.status == 200:
-                    content = await response.text()
-                    root = ET.fromstring(content)
-                    
-                    news_items = []
-                    for item in root.findall('.//item')[:3]:
-                        title = item.find('title').text if item.find('title') is not None else 'タイトル不明'
-                        link = item.find('link').text if item.find('link') is not None else ''
-                        
-                        # 記事内容を取得（description または content:encoded を試す）
-                        description = item.find('description')
-                        content_text = ''
-                        if description is not None and description.text:
-                            content_text = description.text
-                            # HTMLタグを簡単に除去
-                            content_text = re.sub('<[^>]+>', '', content_text)
-                            # 長すぎる場合は省略
-                            if len(content_text) > 200:
-                                content_text = content_text[:200] + '...'
-                        
-                        # タイトル + 内容 + リンク
-                        if content_text:
-                            news_items.append(f'・[{title}](<{link}>)\n　{content_text}')
-                        else:
-                            news_items.append(f'・[{title}](<{link}>)')
-                    
-                    return news_items
-    except Exception as e:
-        print(f'ニュース取得エラー: {e}')
-        return ['ニュースの取得に失敗しました']
-
-async def fetch_yahoo_news():
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(YAHOO_RSS_URL) as response:
-                if response.status == 200:
-                    content = await response.text()
-                    root = ET.fromstring(content)
-                    
-                    news_items = []
-                    for item in root.findall('.//item')[:3]:
-                        title = item.find('title').text if item.find('title') is not None else 'タイトル不明'
-                        link = item.find('link').text if item.find('link') is not None else ''
-                        
-                        # 記事内容を取得
-                        description = item.find('description')
-                        content_text = ''
-                        if description is not None and description.text:
-                            content_text = description.text
-                            # HTMLタグを簡単に除去
-                            content_text = re.sub('<[^>]+>', '', content_text)
-                            # 長すぎる場合は省略
-                            if len(content_text) > 200:
-                                content_text = content_text[:200] + '...'
-                        
-                        # タイトル + 内容 + リンク
-                        if content_text:
-                            news_items.append(f'・[{title}](<{link}>)\n　{content_text}')
-                        else:
-                            news_items.append(f'・[{title}](<{link}>)')
-                    
-                    return news_items
-    except Exception as e:
-        print(f'Yahoo!ニュース取得エラー: {e}')
-        return ['Yahoo!ニュースの取得に失敗しました']
-
-async def fetch_google_news():
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(GOOGLE_NEWS_URL) as response:
-                if response.status == 200:
-                    content = await response.text()
-                    root = ET.fromstring(content)
-                    
-                    news_items = []
-                    for item in root.findall('.//item')[:3]:
-                        title = item.find('title').text if item.find('title') is not None else 'タイトル不明'
-                        link = item.find('link').text if item.find('link') is not None else ''
-                        
-                        # 記事内容を取得
-                        description = item.find('description')
-                        content_text = ''
-                        if description is not None and description.text:
-                            content_text = description.text
-                            # HTMLタグを簡単に除去
-                            content_text = re.sub('<[^>]+>', '', content_text)
-                            # 長すぎる場合は省略
-                            if len(content_text) > 200:
-                                content_text = content_text[:200] + '...'
-                        
-                        # タイトル + 内容 + リンク
-                        if content_text:
-                            news_items.append(f'・[{title}](<{link}>)\n　{content_text}')
-                        else:
-                            news_items.append(f'・[{title}](<{link}>)')
-                    
-                    return news_items
-    except Exception as e:
-        print(f'Google News取得エラー: {e}')
-        return ['Google Newsの取得に失敗しました']
-
-@tasks.loop(time=time(hour=6, minute=0, tzinfo=JST))
-async def morning_news_task():
-    channel = bot.get_channel(GREETING_CHANNEL_ID)
-    if channel:
-        news_items = await fetch_nhk_news()
-        message = '🌅 おはようございます！今日の主要ニュースをお届けします\n\n' + '\n\n'.join(news_items)
-        await channel.send(message)
-
-@tasks.loop(time=time(hour=12, minute=0, tzinfo=JST))
-async def lunch_news_task():
-    channel = bot.get_channel(GREETING_CHANNEL_ID)
-    if channel:
-        news_items = await fetch_yahoo_news()
-        message = '🍽️ お昼のニュースをお届けします\n\n' + '\n\n'.join(news_items)
-        await channel.send(message)
-
-@tasks.loop(time=time(hour=18, minute=0, tzinfo=JST))
-async def evening_news_task():
-    channel = bot.get_channel(GREETING_CHANNEL_ID)
-    if channel:
-        news_items = await fetch_google_news()
-        message = '🌇 夕方のニュースをお届けします\n\n' + '\n\n'.join(news_items)
-        await channel.send(message)
-
-async def send_latest_news(channel):
-    """時間帯に応じて適切なメディアからニュースを取得・送信"""
+
+class FeedSource(NamedTuple):
+    """設定ファイルで定義するニュースソース"""
+    key: str
+    name: str
+    url: str
+    limit: int = 3
+    summary_length: int = 200
+    refresh_interval: int = 300
+    deadline: float = 5.0
+
+
+class GuildConfig(NamedTuple):
+    """ギルド毎の配信設定"""
+    guild_id: int
+    news_channel_id: Optional[int] = None  # 定期配信の送信先（None なら配信しない）
+    echo_channel_id: Optional[int] = None  # エコー機能を使用するチャンネル
+    schedule: Optional[dict] = None        # {slot: source_key / 'all' / None（配信しない）}
+    sources: tuple = ()                    # まとめ（'all'、/news_digest）に含めるソース
+    keywords: tuple = DEFAULT_NEWS_KEYWORDS  # ニューストリガーのキーワード
+
+    def slot_source_key(self, slot):
+        """時間帯に設定されたソースのキー / 'all'（配信しない時間帯は None）"""
+        return self.schedule.get(slot) if self.schedule else None
+
+    def slot_source_keys(self, slot):
+        """時間帯の配信に使うソースのキー"""
+        source_key = self.slot_source_key(slot)
+        if source_key is None:
+            return ()
+        if source_key == ALL_SOURCES_KEY:
+            return self.sources
+        return (source_key,)
+
+
+class NewsItem(NamedTuple):
+    """解析済みの記事1件"""
+    title: str
+    link: str
+    summary: str
+
+
+def load_news_sources(path=NEWS_SOURCES_PATH):
+    """ニュースソース定義を読み込む {key: FeedSource}"""
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+
+    sources = {}
+    for entry in config['sources']:
+        source = FeedSource(**entry)
+        sources[source.key] = source
+    return sources
+
+
+def load_news_schedule(path=NEWS_SOURCES_PATH):
+    """定期配信の時間帯毎のソースを読み込む {slot: source_key または 'all'}"""
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+    schedule = dict(DEFAULT_NEWS_SCHEDULE)
+    schedule.update(config.get('schedule', {}))
+    return schedule
+
+
+def load_guild_configs(sources, default_schedule, path=NEWS_GUILDS_PATH):
+    """ギルド毎の配信設定を読み込む {guild_id: GuildConfig}
+
+    schedule・sources・keywords は "default" の値（なければ default_schedule・全ソース・
+    DEFAULT_NEWS_KEYWORDS）をギルド毎に上書きする。
+    """
+    if not os.path.exists(path):
+        logger.warning('ギルド設定ファイルがありません: %s', path)
+        return {}
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+
+    default = config.get('default', {})
+    base_schedule = dict(default_schedule)
+    base_schedule.update(default.get('schedule', {}))
+    base_sources = tuple(default.get('sources', sources))
+    base_keywords = tuple(default.get('keywords', DEFAULT_NEWS_KEYWORDS))
+
+    guilds = {}
+    for guild_id, guild_config in config.get('guilds', {}).items():
+        schedule = dict(base_schedule)
+        schedule.update(guild_config.get('schedule', {}))
+        guild = GuildConfig(
+            guild_id=int(guild_id),
+            news_channel_id=guild_config.get('news_channel_id'),
+            echo_channel_id=guild_config.get('echo_channel_id'),
+            schedule=schedule,
+            sources=tuple(guild_config.get('sources', base_sources)),
+            keywords=tuple(guild_config.get('keywords', base_keywords)),
+        )
+        unknown = [
+            key for key in (*guild.sources, *schedule.values())
+            if key not in sources and key not in (ALL_SOURCES_KEY, None)
+        ]
+        if unknown:
+            raise ValueError(f'ギルド {guild_id} の設定に未定義のソースがあります: {unknown}')
+        guilds[guild.guild_id] = guild
+    return guilds
+
+
+# フィード関連のメトリクス
+FEED_FETCH_DURATION = REGISTRY.histogram('news_feed_fetch_duration_seconds', 'フィードの取得にかかった時間')
+FEED_PARSE_DURATION = REGISTRY.histogram('news_feed_parse_duration_seconds', 'フィードのXML解析にかかった時間')
+FEED_FETCH_TOTAL = REGISTRY.counter('news_feed_fetch_total', 'フィードの取得回数（結果別）')
+
+
+NEWS_SOURCES = load_news_sources()
+NEWS_SCHEDULE = load_news_schedule()
+GUILD_CONFIGS = load_guild_configs(NEWS_SOURCES, NEWS_SCHEDULE)
+
+
+class FeedFetchError(Exception):
+    """RSSフィードの取得に失敗した"""
+
+
+def _codec_name(encoding):
+    """文字コード名を正規化する（不明なら None）"""
     try:
-        now = datetime.now(JST)
-        current_hour = now.hour
-        
-        # 時間帯に応じてメディアとメッセージを選択
-        if 6 <= current_hour < 12 or current_hour == 7:
-            # 朝の時間帯 - NHKニュース
-            news_items = await fetch_nhk_news()
-            header = "📰 **NHK主要ニュース** (朝の時間帯)"
-            
-        elif 12 <= current_hour < 18 or current_hour == 13:
-            # 昼の時間帯 - Yahoo!ニュース
-            news_items = await fetch_yahoo_news()
-            header = "📰 **Yahoo!ニュース** (お昼の時間帯)"
-            
+        return codecs.lookup(ENCODING_ALIASES.get(encoding.lower(), encoding)).name
+    except LookupError:
+        return None
+
+
+class FeedParser:
+    """RSS/Atom をチャンク単位で解析するパーサー
+
+    記事要素を読み終えるたびに NewsItem へ変換して要素を破棄し、
+    limit 件に達した時点で解析を打ち切る。
+
+    expat は Shift_JIS や EUC-JP などのマルチバイトの文字コードを読めないため、
+    それらのフィードは逐次 UTF-8 に変換し、XML宣言の encoding も書き換えてから渡す。
+    文字コードは encoding（HTTPヘッダーの charset）、XML宣言、UTF-8 の順に決める。
+    """
+
+    def __init__(self, limit, summary_length=200, encoding=None):
+        self.limit = limit
+        self.summary_length = summary_length
+        self.encoding = encoding
+        self.items = []
+        self.parse_time = 0.0  # 解析に使ったCPU時間（秒、ネットワーク待ちは含まない）
+        self._parser = ET.XMLPullParser(events=('end',))
+        self._prolog = b''      # XML宣言を読み終えるまで溜めておく先頭部分
+        self._started = False
+        self._decoder = None    # UTF-8 に変換する場合のデコーダー
+
+    @property
+    def done(self):
+        return len(self.items) >= self.limit
+
+    def feed(self, chunk):
+        """データを流し込む。必要な件数が揃ったら True を返す"""
+        start = time_module.perf_counter()
+        try:
+            data = self._transcode(chunk)
+            if data:
+                self._parser.feed(data)
+            return self._drain()
+        finally:
+            self.parse_time += time_module.perf_counter() - start
+
+    def close(self):
+        """解析を終了して記事リストを返す"""
+        if not self.done:
+            start = time_module.perf_counter()
+            data = self._transcode(b'', final=True)
+            if data:
+                self._parser.feed(data)
+            self._parser.close()
+            self._drain()
+            self.parse_time += time_module.perf_counter() - start
+        return self.items
+
+    def _transcode(self, chunk, final=False):
+        """expat に渡すバイト列（XML宣言を読み終えるまでは空）"""
+        if self._decoder is not None:
+            return self._decoder.decode(chunk, final).encode('utf-8')
+        if self._started:
+            return chunk
+        self._prolog += chunk
+        if not final and b'?>' not in self._prolog and len(self._prolog) < XML_PROLOG_MAX_BYTES:
+            return b''
+        self._started = True
+        prolog, self._prolog = self._prolog, b''
+
+        # XML宣言は ASCII なので、文字コードが分からなくても latin-1 として読める
+        match = XML_ENCODING_RE.match(prolog.decode('latin-1'))
+        declared = _codec_name(match.group(1)) if match else None
+        encoding = _codec_name(self.encoding) if self.encoding else None
+        encoding = encoding or declared or 'utf-8'
+        if encoding == (declared or 'utf-8') and encoding in EXPAT_ENCODINGS:
+            return prolog
+
+        self._decoder = codecs.getincrementaldecoder(encoding)('replace')
+        text = self._decoder.decode(prolog, final)
+        # 変換後の中身に合わせて宣言を UTF-8 にする
+        match = XML_ENCODING_RE.match(text)
+        if match:
+            text = text[:match.start(1)] + 'UTF-8' + text[match.end(1):]
+        return text.encode('utf-8')
+
+    def _drain(self):
+        for _, elem in self._parser.read_events():
+            if _local_name(elem.tag) not in FEED_ITEM_TAGS:
+                continue
+            self.items.append(_element_to_item(elem, self.summary_length))
+            elem.clear()
+            if self.done:
+                return True
+        return False
+
+
+def _local_name(tag):
+    """名前空間を除いたタグ名"""
+    return tag.rsplit('}', 1)[-1]
+
+
+def _element_to_item(elem, summary_length):
+    """記事要素を NewsItem に変換"""
+    title = None
+    link = ''
+    summary = ''
+    for child in elem:
+        name = _local_name(child.tag)
+        if name == 'title':
+            title = child.text
+        elif name == 'link':
+            # RSSは本文、Atomは href 属性（rel="alternate" を優先）
+            href = child.get('href')
+            if href is None:
+                link = link or (child.text or '').strip()
+            elif child.get('rel', 'alternate') == 'alternate' or not link:
+                link = href
+        elif name in FEED_SUMMARY_TAGS and not summary and child.text:
+            summary = clean_summary(child.text, summary_length)
+
+    title = html.unescape(title.strip()) if title else 'タイトル不明'
+    return NewsItem(title, link, summary)
+
+
+def clean_summary(text, max_length=200):
+    """HTMLタグを除去し、実体参照をデコードして長さを制限"""
+    text = HTML_TAG_RE.sub('', text)
+    text = html.unescape(text)
+    text = WHITESPACE_RE.sub(' ', text).strip()
+    # 長すぎる場合は省略
+    if len(text) > max_length:
+        text = text[:max_length] + '...'
+    return text
+
+
+def render_digest(items):
+    """記事リストを投稿用の本文に整形"""
+    return '\n\n'.join(format_news_item(item) for item in items)
+
+
+def format_news_item(item):
+    """記事1件をDiscord投稿用に整形"""
+    # タイトル + 内容 + リンク
+    if item.summary:
+        return f'・[{item.title}](<{item.link}>)\n　{item.summary}'
+    return f'・[{item.title}](<{item.link}>)'
+
+
+async def parse_feed_stream(stream, limit, summary_length=200, source_key='', encoding=None):
+    """レスポンスのストリームを先頭から解析し、limit 件で打ち切る
+
+    encoding は Content-Type の charset（なければXML宣言に従う）。
+    """
+    parser = FeedParser(limit, summary_length, encoding)
+    async for chunk in stream.iter_chunked(FEED_CHUNK_SIZE):
+        if parser.feed(chunk):
+            break
+    items = parser.close()
+    FEED_PARSE_DURATION.observe(parser.parse_time, source=source_key)
+    return items
+
+
+class FeedCacheEntry:
+    """フィード1件分のキャッシュ（解析済みの記事と検証用ヘッダー）"""
+
+    def __init__(self, items, etag, last_modified):
+        self.items = items
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = asyncio.get_running_loop().time()
+
+
+class FeedCache:
+    """フィードURLをキーにしたキャッシュ
+
+    TTL内はメモリから返し、期限切れ後は If-None-Match / If-Modified-Since で
+    再検証する。同じURLへの同時リクエストは1回の取得にまとめる。
+    """
+
+    def __init__(self, http_client, ttl=FEED_CACHE_TTL):
+        self.http_client = http_client
+        self.ttl = ttl
+        self._entries = {}   # {url: FeedCacheEntry}
+        self._inflight = {}  # {url: asyncio.Task}
+
+    async def get(self, source, force=False):
+        """ソースの解析済み記事リストを取得（force=True ならTTL内でも再検証）"""
+        url = source.url
+        entry = self._entries.get(url)
+        if entry is not None and not force and self._is_fresh(entry):
+            return entry.items
+
+        task = self._inflight.get(url)
+        if task is None:
+            task = asyncio.create_task(self._refresh(source, entry))
+            self._inflight[url] = task
+            task.add_done_callback(lambda _: self._inflight.pop(url, None))
+        # 呼び出し側がキャンセルされても取得自体は続ける
+        return await asyncio.shield(task)
+
+    def _is_fresh(self, entry):
+        return asyncio.get_running_loop().time() - entry.fetched_at < self.ttl
+
+    async def _refresh(self, source, entry):
+        url = source.url
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+
+        with FEED_FETCH_DURATION.time(source=source.key):
+            try:
+                items, etag, last_modified = await self._fetch(source, headers)
+            except Exception:
+                FEED_FETCH_TOTAL.inc(source=source.key, result='error')
+                raise
+
+        if items is None:
+            # 変更なし - 解析済みの記事をそのまま使う
+            FEED_FETCH_TOTAL.inc(source=source.key, result='not_modified')
+            entry.fetched_at = asyncio.get_running_loop().time()
+            return entry.items
+
+        FEED_FETCH_TOTAL.inc(source=source.key, result='ok')
+        self._entries[url] = FeedCacheEntry(items, etag, last_modified)
+        return items
+
+    async def _fetch(self, source, headers):
+        """(記事, ETag, Last-Modified) を返す。304 の場合は記事が None"""
+        url = source.url
+        async with self.http_client.get(url, headers=headers) as response:
+            if response.status == 304 and headers:
+                return None, None, None
+            if response.status != 200:
+                raise FeedFetchError(f'HTTP {response.status}: {url}')
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            # 配信済みの記事を除いても件数が足りるよう多めに読む
+            items = await parse_feed_stream(
+                response.content, source.limit * FEED_LOOKAHEAD_FACTOR, source.summary_length,
+                source.key, response.charset,
+            )
+        return items, etag, last_modified
+
+
+class NewsSnapshot(NamedTuple):
+    """ソース毎の最新ニュース（解析済み記事と整形済みダイジェスト）"""
+    items: list
+    digest: str
+    updated_at: float
+
+
+class NewsStore:
+    """バックグラウンドで更新するニュースの保管場所
+
+    各ソースを個別の間隔（ゆらぎ付き）でポーリングし、最新の記事と
+    整形済みダイジェストをメモリに保持する。取得に失敗した場合や
+    更新が遅れている場合は古いダイジェストを返しつつ裏で再取得する。
+    """
+
+    def __init__(self, feed_cache, sources, seen_index=None):
+        self.feed_cache = feed_cache
+        self.sources = sources
+        self.seen_index = seen_index
+        self._snapshots = {}     # {source_key: NewsSnapshot}
+        self._loops = {}         # {source_key: tasks.Loop}
+        self._revalidating = {}  # {source_key: asyncio.Task}
+
+    def start(self):
+        """ソース毎の更新ループを開始"""
+        for source in self.sources.values():
+            if source.key not in self._loops:
+                self._loops[source.key] = self._make_loop(source)
+            if not self._loops[source.key].is_running():
+                self._loops[source.key].start()
+
+    def stop(self):
+        for loop in self._loops.values():
+            loop.cancel()
+        for task in self._revalidating.values():
+            task.cancel()
+
+    def _make_loop(self, source):
+        @tasks.loop(seconds=source.refresh_interval)
+        async def refresh_loop():
+            await self.refresh(source)
+            # 全ソースが同じタイミングで取得しないよう毎回間隔をずらす
+            jitter = source.refresh_interval * FEED_REFRESH_JITTER
+            refresh_loop.change_interval(
+                seconds=source.refresh_interval + random.uniform(-jitter, jitter)
+            )
+
+        return refresh_loop
+
+    async def refresh(self, source, force=True):
+        """ソースを取得してスナップショットを更新（失敗時は既存のものを返す）"""
+        try:
+            items = await self.feed_cache.get(source, force=force)
+        except Exception as e:
+            logger.warning('%s取得エラー: %s', source.name, e)
+            return self._snapshots.get(source.key)
+
+        digest = render_digest(items[:source.limit])
+        snapshot = NewsSnapshot(items, digest, asyncio.get_running_loop().time())
+        self._snapshots[source.key] = snapshot
+        return snapshot
+
+    async def get_digest(self, source_key, dedupe=False, scope=DEFAULT_SCOPE, snapshots=None):
+        """整形済みダイジェストを取得（通常はネットワークを待たない）
+
+        dedupe=True なら scope（ギルドID）で配信済みの記事を除き、残りを配信済みとして記録する。
+        snapshots（prefetch の戻り値）を渡した場合はその中だけで整形し、取得し直さない。
+        """
+        source = self.sources[source_key]
+        if snapshots is not None:
+            snapshot = snapshots.get(source_key)
+            if snapshot is None:
+                return f'{source.name}の取得に失敗しました'
+            return self._render(source, snapshot, dedupe, scope) or f'📭 {source.name}: 新しいニュースはありません'
+
+        snapshot = self._snapshots.get(source_key)
+        if snapshot is None:
+            # 起動直後でまだ取得できていない場合のみ取得を待つ
+            snapshot = await self.refresh(source, force=False)
+            if snapshot is None:
+                return f'{source.name}の取得に失敗しました'
+        elif self._is_stale(source, snapshot):
+            self._revalidate(source)
+        return self._render(source, snapshot, dedupe, scope) or f'📭 {source.name}: 新しいニュースはありません'
+
+    def _render(self, source, snapshot, dedupe, scope):
+        if not dedupe or self.seen_index is None:
+            return snapshot.digest
+        items = self.seen_index.filter_unseen(snapshot.items, limit=source.limit, scope=scope)
+        # 送信前に記録する（送信失敗時の取りこぼしより重複配信の防止を優先）
+        self.seen_index.mark_seen(items, scope=scope)
+        return render_digest(items)
+
+    async def get_combined_digest(self, source_keys=None, dedupe=False, scope=DEFAULT_SCOPE, snapshots=None):
+        """指定したソース（省略時は全ソース）を並行取得してまとめたダイジェストを作成
+
+        各ソースは自身の deadline まで待ち、間に合わなかったソースは
+        注記に置き換える。全体の待ち時間は最も遅いソースの deadline まで。
+        snapshots（prefetch の戻り値）を渡した場合は取得せず、その中にないソースを注記にする。
+        """
+        if source_keys is None:
+            source_keys = self.sources
+        sources = [self.sources[key] for key in source_keys]
+        if snapshots is not None:
+            results = [snapshots.get(source.key) for source in sources]
         else:
-            # 夜の時間帯 - Google News
-            news_items = await fetch_google_news()
-            header = "📰 **Google News** (夜の時間帯)"
-        
-        # ニュースを送信
-        message = header + '\n\n' + '\n\n'.join(news_items)
-        await channel.send(message)
-        print(f"✅ リアルタイムニュース配信完了 - {current_hour}時")
-        
-    except Exception as e:
-        print(f"❌ リアルタイムニュース取得エラー: {e}")
-        await channel.send("❌ ニュースの取得に失敗しました。しばらく時間をおいて再度お試しください。")
-
-@bot.event
-async def on_ready():
-    print(f'{bot.user}としてログインしました！(ニュースBot)')
-    print(f'ニュース配信チャンネル: {GREETING_CHANNEL_ID}')
-    print(f'エコーチャンネル: {ECHO_CHANNEL_ID}')
-    try:
-        synced = await bot.tree.sync()
-        print(f'{len(synced)}個のスラッシュコマンドを同期しました')
-    except Exception as e:
-        print(f'スラッシュコマンドの同期に失敗しました: {e}')
-    
-    morning_news_task.start()
-    lunch_news_task.start()
-    evening_news_task.start()
-    print('📰 ニュース配信タスクを開始しました')
-
-@bot.event
-async def on_message(message):
-    print(f"🔥 on_message呼び出し - 作者: {message.author}")
-    
-    if message.author == bot.user:
-        print(f"🤖 bot自身のメッセージなのでスキップ")
-        return
-    
-    print(f"📋 ギルドID確認 - 受信: {message.guild.id if message.guild else 'なし'}, 期待: {ALLOWED_GUILD_ID}")
-    if message.guild.id != ALLOWED_GUILD_ID:
-        print(f"❌ ギルドID不一致のためスキップ")
-        return
-    
-    print(f"✅ メッセージ受信 - チャンネルID: {message.channel.id}, 作者: {message.author.display_name}, 内容: {message.content}")
-    
-    # ニューストリガー機能
-    content_lower = message.content.lower()
-    if any(keyword in content_lower for keyword in ['ニュース', 'news', '最新', 'ニュース教えて', 'ニュースある？']):
-        await send_latest_news(message.channel)
-        print(f"📰 ニューストリガー実行完了")
-    
-    # エコー機能は特定チャンネルでのみ動作
-    elif message.channel.id == ECHO_CHANNEL_ID:
-        await message.channel.send(message.content)
-        print(f"🔄 エコー送信完了")
-    
-    await bot.process_commands(message)
-
-@bot.event
-async def on_raw_reaction_add(payload):
-    if payload.user_id == bot.user.id:
-        return
-    
-    if payload.guild_id != ALLOWED_GUILD_ID:
-        return
-    
-    if str(payload.emoji) == '👍':
-        channel = bot.get_channel(payload.channel_id)
-        message = await channel.fetch_message(payload.message_id)
-        message_content = message.content[:50] + ('...' if len(message.content) > 50 else '')
-        await channel.send(f'「{message_content}」のメッセージにグッドマークが押されたよ！')
-
-@bot.tree.command(name='news_help', description='ニュースBotの機能を表示します')
-async def news_help_command(interaction: discord.Interaction):
-    if interaction.guild.id != ALLOWED_GUILD_ID:
-        await interaction.response.send_message("このコマンドは指定されたサーバーでのみ使用できます。", ephemeral=True)
-        return
-    
-    embed = discord.Embed(
-        title="📰 ニュースBot機能一覧",
-        description="このbotのニュース配信機能について説明します",
-        color=0x00ff00
-    )
-    
-    embed.add_field(
-        name="⏰ 定期ニュース配信",
-        value="・**06:00** - NHK主要ニュース 3件\n・**12:00** - Yahoo!ニュース 3件\n・**18:00** - Google News 3件",
-        inline=False
-    )
-    
-    embed.add_field(
-        name="💬 その他機能",
-        value="・エコー機能（特定チャンネル）\n・👍 リアクション応答",
-        inline=False
-    )
-    
-    embed.add_field(
-        name="📡 配信チャンネル",
-        value=f"<#{GREETING_CHANNEL_ID}>",
-        inline=False
-    )
-    
-    embed.set_footer(text="24時間自動配信中 📺")
-    
-    await interaction.response.send_message(embed=embed)
-
-@bot.tree.command(name='news_status', description='ニュース配信の状態を確認します')
-async def news_status(interaction: discord.Interaction):
-    if interaction.guild.id != ALLOWED_GUILD_ID:
-        await interaction.response.send_message("このコマンドは指定されたサーバーでのみ使用できます。", ephemeral=True)
-        return
-    
-    now = datetime.now(JST)
-    
-    embed = discord.Embed(
-        title="📊 ニュース配信状態",
-        color=0x0099ff
-    )
-    
-    embed.add_field(
-        name="⏰ 現在時刻",
-        value=now.strftime("%Y-%m-%d %H:%M:%S JST"),
-        inline=False
-    )
-    
-    embed.add_field(
-        name="📰 配信スケジュール",
-        value="朝: 06:00 | 昼: 12:00 | 夜: 18:00",
-        inline=False
-    )
-    
-    embed.add_field(
-        name="📡 配信チャンネル", 
-        value=f"<#{GREETING_CHANNEL_ID}>",
-        inline=False
-    )
-    
-    # 次回配信時間を計算
-    next_times = []
-    for hour in [6, 12, 18]:
-        next_time = now.replace(hour=hour, minute=0, second=0, microsecond=0)
-        if next_time <= now:
-            next_time += timedelta(days=1)
-        next_times.append(next_time)
-    
-    next_broadcast = min(next_times)
-    time_until = next_broadcast - now
-    
-    embed.add_field(
-        name="⏭️ 次回配信",
-        value=f"{next_broadcast.strftime('%H:%M')} (あと{time_until.seconds//3600}時間{(time_until.seconds//60)%60}分)",
-        inline=False
-    )
-    
-    await interaction.response.send_message(embed=embed)
+            results = await asyncio.gather(
+                *(self._snapshot_within_deadline(source) for source in sources)
+            )
+
+        sections = []
+        notes = []
+        for source, snapshot in zip(sources, results):
+            if snapshot is None:
+                notes.append(f'⏱️ {source.name}: 時間内に取得できなかったため省略しました')
+                continue
+            # ソース順に記録するので、先に掲載したソースと重複する記事は後続から除かれる
+            digest = self._render(source, snapshot, dedupe, scope)
+            if digest:
+                sections.append(f'**{source.name}**\n{digest}')
+            else:
+                notes.append(f'📭 {source.name}: 新しいニュースはありません')
+        return '\n\n'.join(sections + notes)
+
+    async def _snapshot_within_deadline(self, source):
+        snapshot = self._snapshots.get(source.key)
+        if snapshot is not None and not self._is_stale(source, snapshot):
+            return snapshot
+        try:
+            # 期限切れ後も取得は続け、次回以降のために保管場所を温めておく
+            return await asyncio.wait_for(
+                asyncio.shield(self.refresh(source, force=False)), timeout=source.deadline
+            )
+        except asyncio.TimeoutError:
+            return None
+
+    async def prefetch(self, source_keys):
+        """ソースのスナップショットを揃えて返す {source_key: NewsSnapshot or None}
+
+        各ソースの取得は1回だけ。戻り値を get_slot_digest などに渡せば、
+        ギルド毎の整形ではネットワークを待たない（取得できなかったソースは注記になる）。
+        """
+        keys = list(source_keys)
+        results = await asyncio.gather(
+            *(self._snapshot_within_deadline(self.sources[key]) for key in keys)
+        )
+        return dict(zip(keys, results))
+
+    async def get_slot_digest(self, guild, slot, dedupe=False, snapshots=None):
+        """ギルドの定期配信の時間帯に設定されたソースのダイジェストを取得"""
+        source_key = guild.slot_source_key(slot)
+        if source_key == ALL_SOURCES_KEY:
+            return await self.get_combined_digest(
+                guild.sources, dedupe, scope=guild.guild_id, snapshots=snapshots
+            )
+        return await self.get_digest(source_key, dedupe, scope=guild.guild_id, snapshots=snapshots)
+
+    def _is_stale(self, source, snapshot):
+        age = asyncio.get_running_loop().time() - snapshot.updated_at
+        return age > source.refresh_interval * 2
+
+    def _revalidate(self, source):
+        """古いダイジェストを返している間に裏で再取得"""
+        if source.key in self._revalidating:
+            return
+        task = asyncio.create_task(self.refresh(source))
+        self._revalidating[source.key] = task
+        task.add_done_callback(lambda _: self._revalidating.pop(source.key, None))
+
+
+def compile_keywords(keywords):
+    """キーワードの一覧を1つの正規表現にまとめる（大文字小文字は区別しない）"""
+    # 長いキーワードを先に並べて最長一致させる
+    ordered = sorted(set(keywords), key=len, reverse=True)
+    return re.compile('|'.join(re.escape(keyword) for keyword in ordered), re.IGNORECASE)
+
+
+class NewsTrigger:
+    """投稿内のキーワードでニュースを返信するトリガー
+
+    キーワードはギルド毎の設定（GuildConfig.keywords）で、事前にコンパイルした正規表現1回で照合する。
+    チャンネル毎にクールダウンを設け、期間内に続いたトリガーは最初の1回の返信にまとめる。
+    """
+
+    def __init__(self, guilds, cooldown=NEWS_TRIGGER_COOLDOWN, max_length=NEWS_TRIGGER_MAX_LENGTH):
+        self.cooldown = cooldown
+        self.max_length = max_length
+        # 同じキーワードのギルドは正規表現を共有する
+        compiled = {}
+        self._patterns = {}
+        for guild in guilds.values():
+            if guild.keywords not in compiled:
+                compiled[guild.keywords] = compile_keywords(guild.keywords)
+            self._patterns[guild.guild_id] = compiled[guild.keywords]
+        self._last_fired = LRUCache(NEWS_TRIGGER_CACHE_SIZE)  # {channel_id: 最後に返信した時刻}
+
+    def matches(self, message):
+        """投稿がトリガーのキーワードを含むか（長文の貼り付けは対象外）"""
+        content = message.content
+        if not content or len(content) > self.max_length:
+            return False
+        pattern = self._patterns.get(message.guild.id)
+        return pattern is not None and pattern.search(content) is not None
+
+    def acquire(self, channel_id):
+        """クールダウン中でなければ返信権を取得して True を返す"""
+        now = asyncio.get_running_loop().time()
+        last = self._last_fired.get(channel_id)
+        if last is not None and now - last < self.cooldown:
+            return False
+        self._last_fired.put(channel_id, now)
+        return True
+
+
+def make_snippet(content):
+    """リアクション通知で引用するメッセージの先頭部分"""
+    return content[:SNIPPET_LENGTH] + ('...' if len(content) > SNIPPET_LENGTH else '')
+
+
+def slot_display_name(guild, slot):
+    """ギルドの時間帯に設定されたソースの表示名"""
+    source_key = guild.slot_source_key(slot)
+    if source_key is None:
+        return '配信なし'
+    if source_key == ALL_SOURCES_KEY:
+        return 'ニュースまとめ'
+    return NEWS_SOURCES[source_key].name
+
+
+def guild_config_for(interaction):
+    """コマンドを実行したギルドの設定（設定のないギルドなら None）"""
+    if interaction.guild is None:
+        return None
+    return GUILD_CONFIGS.get(interaction.guild.id)
+
+
+class NewsCog(commands.Cog):
+    """ニュース配信機能（定期配信・ニューストリガー・エコー・リアクション応答）
+
+    HTTPクライアント・送信キュー・メッセージキャッシュはBot（bot_base.SharedBot）のものを使う。
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.feed_cache = FeedCache(bot.http_client)
+        self.seen_index = SeenIndex(SEEN_INDEX_PATH, SEEN_INDEX_MAX_AGE_DAYS)
+        self.news_store = NewsStore(self.feed_cache, NEWS_SOURCES, self.seen_index)
+        self.news_trigger = NewsTrigger(GUILD_CONFIGS)
+        self.reaction_notices = LRUCache(REACTION_NOTICE_CACHE_SIZE)  # {message_id: 最後に通知した時刻}
+        self.reaction_inflight = set()  # 通知を送っている途中のメッセージID
+
+    async def cog_load(self):
+        self.seen_index.open()
+        self.news_store.start()
+        # 読み込み直しても二重に起動しない
+        for task in self.delivery_tasks():
+            if not task.is_running():
+                task.start()
+        logger.info('📰 ニュース配信タスクを開始しました')
+
+    async def cog_unload(self):
+        for task in self.delivery_tasks():
+            task.cancel()
+        self.news_store.stop()
+        self.seen_index.close()
+
+    def delivery_tasks(self):
+        return (self.morning_news_task, self.lunch_news_task, self.evening_news_task)
+
+    async def deliver_slot(self, slot, greeting):
+        """時間帯のニュースを購読している全ギルドへ配信
+
+        必要なソースを先に1回ずつ取得し、その結果をギルド毎に整形して送る。
+        """
+        # チャンネルのキャッシュが揃うまで待つ
+        await self.bot.wait_until_ready()
+        subscribers = []
+        for guild in GUILD_CONFIGS.values():
+            if guild.news_channel_id is None or guild.slot_source_key(slot) is None:
+                continue
+            channel = self.bot.get_channel(guild.news_channel_id)
+            if channel is not None:
+                subscribers.append((guild, channel))
+        if not subscribers:
+            return
+
+        snapshots = await self.news_store.prefetch(
+            {key for guild, _ in subscribers for key in guild.slot_source_keys(slot)}
+        )
+        for guild, channel in subscribers:
+            digest = await self.news_store.get_slot_digest(guild, slot, dedupe=True, snapshots=snapshots)
+            self.bot.outbound.send(channel, greeting + '\n\n' + digest, priority=PRIORITY_DIGEST)
+        logger.info('📰 %s の配信を %d ギルドへ送信しました', slot, len(subscribers))
+
+    @tasks.loop(time=time(hour=SLOT_HOURS['morning'], minute=0, tzinfo=JST))
+    async def morning_news_task(self):
+        await self.deliver_slot('morning', '🌅 おはようございます！今日の主要ニュースをお届けします')
+
+    @tasks.loop(time=time(hour=SLOT_HOURS['lunch'], minute=0, tzinfo=JST))
+    async def lunch_news_task(self):
+        await self.deliver_slot('lunch', '🍽️ お昼のニュースをお届けします')
+
+    @tasks.loop(time=time(hour=SLOT_HOURS['evening'], minute=0, tzinfo=JST))
+    async def evening_news_task(self):
+        await self.deliver_slot('evening', '🌇 夕方のニュースをお届けします')
+
+    @timed('send_latest_news')
+    async def send_latest_news(self, channel, guild):
+        """時間帯に応じて適切なメディアからニュースを取得・送信"""
+        try:
+            now = datetime.now(JST)
+            current_hour = now.hour
+
+            # 時間帯に応じてメディアとメッセージを選択
+            if 6 <= current_hour < 12:
+                slot, label = 'morning', '朝の時間帯'
+            elif 12 <= current_hour < 18:
+                slot, label = 'lunch', 'お昼の時間帯'
+            else:
+                slot, label = 'evening', '夜の時間帯'
+
+            if guild.slot_source_key(slot) is None:
+                # この時間帯の配信がないギルドでは全ソースのまとめを返す
+                digest = await self.news_store.get_combined_digest(guild.sources, dedupe=True, scope=guild.guild_id)
+                header = f"📰 **ニュースまとめ** ({label})"
+            else:
+                digest = await self.news_store.get_slot_digest(guild, slot, dedupe=True)
+                header = f"📰 **{slot_display_name(guild, slot)}** ({label})"
+
+            # ニュースを送信
+            message = header + '\n\n' + digest
+            self.bot.outbound.send(channel, message, priority=PRIORITY_REPLY)
+            logger.info("✅ リアルタイムニュース配信完了 - %s時", current_hour)
+
+        except Exception as e:
+            logger.exception("❌ リアルタイムニュース取得エラー: %s", e)
+            self.bot.outbound.send(channel, "❌ ニュースの取得に失敗しました。しばらく時間をおいて再度お試しください。")
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        logger.info('%sとしてログインしました！(ニュースBot)', self.bot.user)
+        logger.info('設定済みギルド: %d / 参加ギルド: %d / シャード数: %s',
+                    len(GUILD_CONFIGS), len(self.bot.guilds), self.bot.shard_count)
+
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        # リアクション応答用に先頭部分を覚えておく（Bot自身の投稿も対象）
+        self.bot.message_cache.put(message.id, make_snippet(message.content))
+
+        if message.author == self.bot.user:
+            return
+
+        if message.guild is None:
+            return
+        guild = GUILD_CONFIGS.get(message.guild.id)
+        if guild is None:
+            return
+
+        # DEBUGログはサンプリングしたイベントだけ整形・出力する
+        trace = sample_event(logger)
+        if trace:
+            logger.debug("メッセージ受信 - チャンネルID: %s, 作者: %s, 内容: %s",
+                         message.channel.id, message.author.display_name, message.content)
+
+        # ニューストリガー機能（クールダウン中は最初の返信にまとめる）
+        if self.news_trigger.matches(message):
+            if self.news_trigger.acquire(message.channel.id):
+                await self.send_latest_news(message.channel, guild)
+                logger.info("📰 ニューストリガー実行完了 - チャンネルID: %s", message.channel.id)
+
+        # エコー機能は特定チャンネルでのみ動作
+        elif message.channel.id == guild.echo_channel_id:
+            self.bot.outbound.send(message.channel, message.content, priority=PRIORITY_CHATTER)
+            if trace:
+                logger.debug("🔄 エコー送信完了")
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_add(self, payload):
+        if payload.user_id == self.bot.user.id:
+            return
+
+        if payload.guild_id not in GUILD_CONFIGS:
+            return
+
+        if str(payload.emoji) == '👍':
+            # 同じメッセージへの👍が続いた場合は1回の通知にまとめる（送信中のものも含める）
+            message_id = payload.message_id
+            now = asyncio.get_running_loop().time()
+            last_notice = self.reaction_notices.get(message_id)
+            if last_notice is not None and now - last_notice < REACTION_COALESCE_WINDOW:
+                return
+            if message_id in self.reaction_inflight:
+                return
+            channel = self.bot.get_channel(payload.channel_id)
+            if channel is None:
+                return
+
+            self.reaction_inflight.add(message_id)
+            future = None
+            try:
+                message_content = await self.reaction_snippet(channel, message_id)
+                if message_content is not None:
+                    future = self.bot.outbound.send(
+                        channel, f'「{message_content}」のメッセージにグッドマークが押されたよ！',
+                        priority=PRIORITY_CHATTER,
+                    )
+                    future.add_done_callback(lambda f: self._reaction_notice_sent(message_id, f))
+            finally:
+                if future is None:
+                    self.reaction_inflight.discard(message_id)
+
+    async def reaction_snippet(self, channel, message_id):
+        """通知で引用するメッセージの先頭部分（取得できなければ None）"""
+        message_content = self.bot.message_cache.get(message_id)
+        if message_content is not None:
+            return message_content
+        # discord.py のメッセージキャッシュにもないものだけREST APIで取得する
+        message = self.bot._connection._get_message(message_id)
+        if message is None:
+            try:
+                message = await channel.fetch_message(message_id)
+            except discord.HTTPException as e:
+                logger.warning("リアクションされたメッセージを取得できませんでした (%s): %s", message_id, e)
+                return None
+        message_content = make_snippet(message.content)
+        self.bot.message_cache.put(message_id, message_content)
+        return message_content
+
+    def _reaction_notice_sent(self, message_id, future):
+        # 送れた場合だけ通知済みにする（失敗したら次の👍で通知し直す）
+        self.reaction_inflight.discard(message_id)
+        if not future.cancelled() and future.result() is not None:
+            self.reaction_notices.put(message_id, asyncio.get_running_loop().time())
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload):
+        # 覚えている先頭部分だけ更新する（知らないメッセージは取得しない）
+        if payload.message_id in self.bot.message_cache and 'content' in payload.data:
+            self.bot.message_cache.put(payload.message_id, make_snippet(payload.data['content']))
+
+    @app_commands.command(name='news_help', description='ニュースBotの機能を表示します')
+    @timed('command:news_help')
+    async def news_help_command(self, interaction: discord.Interaction):
+        guild = guild_config_for(interaction)
+        if guild is None:
+            await interaction.response.send_message("このコマンドは指定されたサーバーでのみ使用できます。", ephemeral=True)
+            return
+
+        embed = discord.Embed(
+            title="📰 ニュースBot機能一覧",
+            description="このbotのニュース配信機能について説明します",
+            color=0x00ff00
+        )
+
+        embed.add_field(
+            name="⏰ 定期ニュース配信",
+            value="\n".join(
+                f"・**{SLOT_HOURS[slot]:02d}:00** - {slot_display_name(guild, slot)}" for slot in SLOT_HOURS
+            ),
+            inline=False
+        )
+
+        embed.add_field(
+            name="💬 その他機能",
+            value="・`/news_digest` 全ソースのまとめ\n・エコー機能（特定チャンネル）\n・👍 リアクション応答",
+            inline=False
+        )
+
+        embed.add_field(
+            name="📡 配信チャンネル",
+            value=f"<#{guild.news_channel_id}>" if guild.news_channel_id else "未設定",
+            inline=False
+        )
+
+        embed.set_footer(text="24時間自動配信中 📺")
+
+        await interaction.response.send_message(embed=embed)
+
+    @app_commands.command(name='news_digest', description='全ソースのニュースをまとめて表示します')
+    @timed('command:news_digest')
+    async def news_digest(self, interaction: discord.Interaction):
+        guild = guild_config_for(interaction)
+        if guild is None:
+            await interaction.response.send_message("このコマンドは指定されたサーバーでのみ使用できます。", ephemeral=True)
+            return
+
+        # ソースの応答待ちで3秒を超えることがあるため先に応答を保留する
+        await interaction.response.defer()
+        digest = await self.news_store.get_combined_digest(guild.sources)
+        message = '📰 **ニュースまとめ**\n\n' + digest
+        for chunk in split_message(message):
+            await interaction.followup.send(chunk)
+
+    @app_commands.command(name='news_status', description='ニュース配信の状態を確認します')
+    @timed('command:news_status')
+    async def news_status(self, interaction: discord.Interaction):
+        guild = guild_config_for(interaction)
+        if guild is None:
+            await interaction.response.send_message("このコマンドは指定されたサーバーでのみ使用できます。", ephemeral=True)
+            return
+
+        now = datetime.now(JST)
+
+        embed = discord.Embed(
+            title="📊 ニュース配信状態",
+            color=0x0099ff
+        )
+
+        embed.add_field(
+            name="⏰ 現在時刻",
+            value=now.strftime("%Y-%m-%d %H:%M:%S JST"),
+            inline=False
+        )
+
+        embed.add_field(
+            name="📰 配信スケジュール",
+            value=" | ".join(
+                f"{label}: {SLOT_HOURS[slot]:02d}:00" for slot, label in (('morning', '朝'), ('lunch', '昼'), ('evening', '夜'))
+                if guild.slot_source_key(slot) is not None
+            ) or "配信なし",
+            inline=False
+        )
+
+        embed.add_field(
+            name="📡 配信チャンネル", 
+            value=f"<#{guild.news_channel_id}>" if guild.news_channel_id else "未設定",
+            inline=False
+        )
+
+        # 次回配信時間を計算
+        next_times = []
+        for hour in (SLOT_HOURS[slot] for slot in SLOT_HOURS if guild.slot_source_key(slot) is not None):
+            next_time = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+            if next_time <= now:
+                next_time += timedelta(days=1)
+            next_times.append(next_time)
+
+        if next_times:
+            next_broadcast = min(next_times)
+            time_until = next_broadcast - now
+
+            embed.add_field(
+                name="⏭️ 次回配信",
+                value=f"{next_broadcast.strftime('%H:%M')} (あと{time_until.seconds//3600}時間{(time_until.seconds//60)%60}分)",
+                inline=False
+            )
+
+        fetch_count, fetch_mean, fetch_peak = FEED_FETCH_DURATION.summary()
+        embed.add_field(
+            name="📈 パフォーマンス",
+            value=f"フィード取得: {fetch_count} 回 / 平均 {fetch_mean * 1000:.0f}ms / 最大 {fetch_peak * 1000:.0f}ms\n"
+                  + format_summary(),
+            inline=False
+        )
+
+        await interaction.response.send_message(embed=embed)
+
+
+async def setup(bot):
+    """拡張として読み込むときの入口（bot_main.py から使う）"""
+    await bot.add_cog(NewsCog(bot))
+
 
 if __name__ == '__main__':
+    setup_logging()
     token = os.getenv('DISCORD_TOKEN_NEWS')
     if token:
-        bot.run(token)
+        # discord.py のログもキュー経由の共通設定で出力する
+        SharedBot(cogs=[NewsCog]).run(token, log_handler=None)
     else:
-        print('DISCORD_TOKEN_NEWSが設定されていません。.env.newsファイルを確認してください。')
\ No newline at end of file
+        logger.error('DISCORD_TOKEN_NEWSが設定されていません。.env.newsファイルを確認してください。')
@@ -0,0 +1,110 @@
+"""ObsidianBotのノートのまとめ出力（zip）
+
+指定した期間の日毎のマークダウンを、1日1ファイルの zip にまとめる。
+イベントループを止めないよう、ワーカースレッドで実行する前提で書いている。
+
+- メッセージは保存先のDBを別の接続で読む（WALなので書き込み中でも読める）
+- 1日分ずつ行を整形しながら圧縮して一時ファイルに書くので、全体をメモリに持たない
+- まず各日の圧縮後の大きさを求め、添付ファイルの上限に収まるように日付順に
+  複数の zip に振り分けてから書き出す（同じ内容を2回圧縮する）
+"""
+import logging
+import os
+import sqlite3
+import zipfile
+import zlib
+
+from message_store import StoredMessage
+
+logger = logging.getLogger(__name__)
+
+# 圧縮するときにまとめて書き込む大きさ（バイト）
+WRITE_CHUNK_SIZE = 64 * 1024
+
+# zip の1ファイルあたりの管理情報（ローカルヘッダー・セントラルディレクトリ）の大きさ
+_ENTRY_OVERHEAD = 30 + 46
+_ARCHIVE_OVERHEAD = 22 + 1024  # 終端レコードと余裕
+
+
+class NoteTooLarge(Exception):
+    """1日分だけで添付ファイルの上限を超える"""
+
+
+def _day_chunks(conn, date_str, count, render_line, render_header):
+    """1日分のマークダウンを WRITE_CHUNK_SIZE 程度のバイト列に分けて返す"""
+    rows = conn.execute(
+        'SELECT message_id, timestamp, author, content FROM messages WHERE date = ? ORDER BY timestamp, message_id',
+        (date_str,),
+    )
+    buffer = [render_header(date_str, count).encode('utf-8')]
+    size = len(buffer[0])
+    for message_id, timestamp, author, content in rows:
+        line = render_line(StoredMessage(message_id, int(timestamp), author, content)).encode('utf-8')
+        buffer.append(line)
+        size += len(line)
+        if size >= WRITE_CHUNK_SIZE:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def _compressed_size(chunks):
+    # zipfile の ZIP_DEFLATED と同じ設定で圧縮した大きさ
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    size = sum(len(compressor.compress(chunk)) for chunk in chunks)
+    return size + len(compressor.flush())
+
+
+def plan_archives(sizes, limit):
+    """[(date_str, 圧縮後の大きさ)] を日付順のまま limit に収まるグループに分ける"""
+    groups = []
+    current = []
+    current_size = _ARCHIVE_OVERHEAD
+    for date_str, size in sizes:
+        entry_size = size + _ENTRY_OVERHEAD + 2 * len(f'{date_str}.md')
+        if entry_size + _ARCHIVE_OVERHEAD > limit:
+            raise NoteTooLarge(date_str)
+        if current and current_size + entry_size > limit:
+            groups.append(current)
+            current = []
+            current_size = _ARCHIVE_OVERHEAD
+        current.append(date_str)
+        current_size += entry_size
+    if current:
+        groups.append(current)
+    return groups
+
+
+def write_note_archives(db_path, counts, render_line, render_header, limit, directory, prefix='notes'):
+    """日毎のマークダウンを limit バイト以下の zip に分けて directory に書き出す
+
+    counts は {date_str: 件数}（日付順に並べて出力する）。書き出した zip のパスの一覧を返す。
+    """
+    dates = sorted(date_str for date_str, count in counts.items() if count)
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        sizes = [
+            (date_str, _compressed_size(_day_chunks(conn, date_str, counts[date_str], render_line, render_header)))
+            for date_str in dates
+        ]
+        groups = plan_archives(sizes, limit)
+
+        paths = []
+        for index, group in enumerate(groups, 1):
+            suffix = f'_{index}of{len(groups)}' if len(groups) > 1 else ''
+            path = os.path.join(directory, f'{prefix}_{group[0]}_{group[-1]}{suffix}.zip')
+            with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+                for date_str in group:
+                    with archive.open(f'{date_str}.md', 'w') as entry:
+                        for chunk in _day_chunks(conn, date_str, counts[date_str], render_line, render_header):
+                            entry.write(chunk)
+            size = os.path.getsize(path)
+            if size > limit:
+                # 見積もりと実際がずれることはないはずだが、送信前に気付けるようにする
+                logger.warning('zip が上限を超えました: %s (%d > %d バイト)', path, size, limit)
+            paths.append(path)
+        return paths
+    finally:
+        conn.close()
@@ -0,0 +1,109 @@
+"""ObsidianBotのノート自動出力のスケジューラー
+
+メッセージ1件ごとにファイルを送ると、活発なチャンネルではメッセージ数が倍になり、
+ほぼ同じ内容のファイルを何度も送ることになる。ここでは出力が必要な日付を
+溜めておき、次のいずれかを満たしたときにまとめて1回だけ出力する。
+
+- debounce: 最後のメッセージから debounce 秒、新しいメッセージが来なかった
+- max_pending: 未出力のメッセージが max_pending 件に達した
+- max_delay: 最初の未出力のメッセージから max_delay 秒経った（投稿が続いても出力する）
+
+debounce を 0 にすると max_delay 秒毎の定期出力になる。
+"""
+import asyncio
+import logging
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+
+class ExportPolicy(NamedTuple):
+    debounce: float = 30.0
+    max_pending: int = 50
+    max_delay: float = 300.0
+
+
+class ExportScheduler:
+    """日付毎の未出力のメッセージ数を数え、ポリシーに従って flush_callback を呼ぶ
+
+    flush_callback は `async (date_str, pending_count)`。`start()` で待機を始め、
+    終了時は `close()` で残りを出力する。
+    """
+
+    def __init__(self, flush_callback, policy=ExportPolicy()):
+        self.flush_callback = flush_callback
+        self.policy = policy
+        self._pending = {}          # {date_str: 未出力のメッセージ数}
+        self._pending_total = 0
+        self._first_at = None       # 最初の未出力のメッセージの時刻
+        self._last_at = None        # 最後のメッセージの時刻
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._closing = False
+        self._flush_lock = asyncio.Lock()
+
+    @property
+    def pending_total(self):
+        return self._pending_total
+
+    def start(self):
+        self._closing = False
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def notify(self, date_str):
+        """date_str の日にメッセージが1件増えたことを知らせる"""
+        now = asyncio.get_running_loop().time()
+        self._pending[date_str] = self._pending.get(date_str, 0) + 1
+        self._pending_total += 1
+        if self._first_at is None:
+            self._first_at = now
+        self._last_at = now
+        # 期限を計算し直させる（max_pending に達していればすぐに出力される）
+        self._wakeup.set()
+
+    async def flush(self):
+        """未出力の日付をすべて出力（日付順）"""
+        async with self._flush_lock:
+            pending, self._pending = self._pending, {}
+            self._pending_total = 0
+            self._first_at = self._last_at = None
+            for date_str in sorted(pending):
+                try:
+                    await self.flush_callback(date_str, pending[date_str])
+                except Exception:
+                    logger.exception('%s のノート出力に失敗しました', date_str)
+
+    async def close(self):
+        """待機をやめ、残りを出力する"""
+        # wait_for の最中に cancel すると取り消しが握りつぶされることがあるため、フラグで止める
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def _deadline(self):
+        deadline = self._first_at + self.policy.max_delay
+        if self.policy.debounce <= 0:
+            # debounce なしは max_delay 秒毎の定期出力
+            return deadline
+        return min(self._last_at + self.policy.debounce, deadline)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while not self._closing:
+            self._wakeup.clear()
+            if not self._pending:
+                await self._wakeup.wait()
+                continue
+            if self._pending_total < self.policy.max_pending:
+                timeout = self._deadline() - loop.time()
+                if timeout > 0:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout)
+                        continue
+                    except asyncio.TimeoutError:
+                        pass
+            await self.flush()
@@ -0,0 +1,81 @@
+"""ObsidianBotのメッセージ検索（文字 n-gram）
+
+日本語は単語の区切りがないため、本文を文字の2-gram（バイグラム）に分けて
+SQLite FTS5 の転置インデックスに入れる。検索語も同じように分け、連続した
+2-gram のフレーズとして照合するので、形態素解析なしで任意の部分文字列を探せる。
+
+- 英数字・かな・漢字以外の文字（空白・記号）で区切り、区切りをまたぐ 2-gram は作らない
+- 2-gram に加えて各文字も1文字のトークンとして入れ、1文字の検索語はそれで探す
+  （区間の末尾の文字も見つかる。インデックスは2-gramだけの場合の約2倍になる）
+- NFKC で正規化し、小文字にそろえる（全角英数字や半角カナも同じように見つかる）
+"""
+import re
+import unicodedata
+
+# 検索結果の抜粋の前後の文字数
+SNIPPET_CONTEXT = 40
+
+_SEPARATOR_RE = re.compile(r'[\W_]+')
+
+
+def normalize(text):
+    return unicodedata.normalize('NFKC', text).lower()
+
+
+def _segments(text):
+    return [segment for segment in _SEPARATOR_RE.split(normalize(text)) if segment]
+
+
+def _segment_grams(segment):
+    return [segment[i:i + 2] for i in range(len(segment) - 1)]
+
+
+def ngram_text(text):
+    """インデックスに入れる形（区間毎の 2-gram と1文字を空白で区切った文字列）
+
+    1文字のトークンは 2-gram の後ろに置くので、2-gram のフレーズの照合には影響しない。
+    """
+    return ' '.join(
+        gram for segment in _segments(text) for gram in (*_segment_grams(segment), *segment)
+    )
+
+
+def match_query(query):
+    """検索語から FTS5 の MATCH 式を作る（語が空なら None）
+
+    空白区切りの語はすべて含むもの（AND）を探す。
+    """
+    phrases = []
+    for segment in _segments(query):
+        if len(segment) == 1:
+            phrases.append(f'"{segment}"')
+        else:
+            phrases.append('"' + ' '.join(_segment_grams(segment)) + '"')
+    return ' AND '.join(phrases) or None
+
+
+def make_snippet(content, query, context=SNIPPET_CONTEXT):
+    """検索語の最初の出現箇所の前後を切り出した抜粋と、その中の一致範囲 (start, end)
+
+    一致範囲が見つからない（記号をまたいで一致した）ときは先頭を返し、範囲は None。
+    """
+    folded = normalize(content)
+    # NFKC で長さが変わる場合は位置がずれるので、元の本文で探す
+    haystack = folded if len(folded) == len(content) else content.lower()
+    position = -1
+    length = 0
+    for segment in _segments(query):
+        position = haystack.find(segment)
+        if position >= 0:
+            length = len(segment)
+            break
+    if position < 0:
+        snippet = content[:context * 2]
+        return snippet + ('...' if len(content) > len(snippet) else ''), None
+
+    start = max(0, position - context)
+    end = min(len(content), position + length + context)
+    prefix = '...' if start > 0 else ''
+    suffix = '...' if end < len(content) else ''
+    match_start = len(prefix) + position - start
+    return prefix + content[start:end] + suffix, (match_start, match_start + length)
@@ -1,17 +1,27 @@
+import asyncio
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
 import os
 from dotenv import load_dotenv
-from datetime import datetime, timezone, timedelta
+from datetime import time, datetime, timezone, timedelta
 import io
+import logging
+import tempfile
 
-load_dotenv('.env.obsidian')
+from bot_base import LRUCache, SharedBot
+from bot_logging import sample_event, setup_logging
+from message_store import MessageStore, message_sort_key
+from note_archive import NoteTooLarge, write_note_archives
+from note_export import ExportPolicy, ExportScheduler
+from note_search import make_snippet
+from metrics import REGISTRY, format_summary, timed
+from outbound import PRIORITY_REPLY
+from vault_sink import VaultSink
 
-intents = discord.Intents.default()
-intents.message_content = True
+load_dotenv('.env.obsidian')
 
-bot = commands.Bot(command_prefix='!', intents=intents)
+logger = logging.getLogger('obsidian_bot')
 
 # 設定
 ALLOWED_GUILD_ID = 1397720381149806723
@@ -19,87 +29,201 @@ OBSIDIAN_CHANNEL_ID = 1398238810730664056
 
 # 日本時間のタイムゾーン
 JST = timezone(timedelta(hours=9))
+JST_OFFSET = 9 * 3600
+
+# メッセージの保存先（直近 OBSIDIAN_RECENT_DAYS 日分だけメモリに保持）
+OBSIDIAN_STORE_PATH = os.getenv('OBSIDIAN_STORE_PATH', 'obsidian_messages.sqlite3')
+OBSIDIAN_RECENT_DAYS = int(os.getenv('OBSIDIAN_RECENT_DAYS', '3'))
+OBSIDIAN_FLUSH_INTERVAL = float(os.getenv('OBSIDIAN_FLUSH_INTERVAL', '2.0'))  # 保存をまとめる時間（秒）
+
+# 起動時・再接続時の履歴の取り込み（停止中に投稿されたメッセージを補う）
+OBSIDIAN_BACKFILL_ENABLED = os.getenv('OBSIDIAN_BACKFILL_ENABLED', '1') == '1'
+OBSIDIAN_BACKFILL_PAGE_SIZE = int(os.getenv('OBSIDIAN_BACKFILL_PAGE_SIZE', '100'))  # 1回に取得する件数（APIの上限は100）
+OBSIDIAN_BACKFILL_DELAY = float(os.getenv('OBSIDIAN_BACKFILL_DELAY', '1.0'))        # ページ間の待ち時間（秒）
+OBSIDIAN_BACKFILL_MAX_DAYS = int(os.getenv('OBSIDIAN_BACKFILL_MAX_DAYS', '7'))      # 記録がないときに遡る日数
+
+# どこまで履歴を取り込んだか（このID以前は欠けずに保存済み）
+HISTORY_CHECKPOINT = f'history:{OBSIDIAN_CHANNEL_ID}'
+
+# /search_notes で表示する件数
+SEARCH_RESULT_LIMIT = 10
+
+# /export_notes で1回にまとめられる日数と、zip 1つあたりの大きさの上限（バイト）
+EXPORT_MAX_DAYS = int(os.getenv('OBSIDIAN_EXPORT_RANGE_MAX_DAYS', '366'))
+ATTACHMENT_LIMIT = int(os.getenv('OBSIDIAN_ATTACHMENT_LIMIT', str(24 * 1024 * 1024)))
+
+# ノートの自動出力
+# - upload: 出力のたびに新しい .md を添付して送る
+# - edit: 日毎に1通だけ送ってピン留めし、以降はその添付ファイルを差し替える
+OBSIDIAN_EXPORT_MODE = os.getenv('OBSIDIAN_EXPORT_MODE', 'upload')
+EXPORT_POLICY = ExportPolicy(
+    debounce=float(os.getenv('OBSIDIAN_EXPORT_DEBOUNCE', '30')),       # 最後の投稿からの待ち時間（秒）
+    max_pending=int(os.getenv('OBSIDIAN_EXPORT_MAX_PENDING', '50')),   # この件数が溜まったらすぐ出力
+    max_delay=float(os.getenv('OBSIDIAN_EXPORT_MAX_DELAY', '300')),    # 投稿が続いてもこの秒数毎には出力
+)
+
+# Vault（フォルダ）への直接の書き出し（未設定なら書き出さない）
+OBSIDIAN_VAULT_PATH = os.getenv('OBSIDIAN_VAULT_PATH')
+OBSIDIAN_VAULT_FLUSH_INTERVAL = float(os.getenv('OBSIDIAN_VAULT_FLUSH_INTERVAL', '5.0'))  # 書き出しをまとめる時間（秒）
+
+message_store = MessageStore(OBSIDIAN_STORE_PATH, OBSIDIAN_RECENT_DAYS, flush_interval=OBSIDIAN_FLUSH_INTERVAL)
+
+# 日毎のマークダウン（サニタイズ済みの行）のキャッシュ
+note_cache = LRUCache(OBSIDIAN_RECENT_DAYS)  # {date_str: DayNote}
+
+vault_sink = VaultSink(OBSIDIAN_VAULT_PATH) if OBSIDIAN_VAULT_PATH else None
 
-# メモリ上でメッセージを管理
-daily_messages = {}  # {date_str: [messages...]}
+# 保持しているメッセージ量のメトリクス（出力時に集計）
+STORED_DAYS = REGISTRY.gauge('obsidian_stored_days', '保存しているメッセージの日数')
+STORED_DAYS.set_function(lambda: message_store.day_count)
+STORED_MESSAGES = REGISTRY.gauge('obsidian_stored_messages', '保存しているメッセージ数')
+STORED_MESSAGES.set_function(lambda: message_store.total)
+CACHED_MESSAGES = REGISTRY.gauge('obsidian_cached_messages', 'メモリ上に保持しているメッセージ数')
+CACHED_MESSAGES.set_function(lambda: message_store.cached_count)
+NOTE_EXPORTS = REGISTRY.counter('obsidian_note_exports_total', 'ノートを自動出力した回数')
 
 def add_message_to_memory(message):
-    """メッセージをメモリに追加"""
+    """メッセージを保存先に追加（直近の日ならメモリにも保持）
+
+    追加した日付を返す。同じメッセージを受け取り済みなら何もせず None を返す。
+    """
+    if message.id in message_store:
+        return None
     # 日本時間での日付を取得
     jst_date = message.created_at.astimezone(JST)
     date_str = jst_date.strftime("%Y-%m-%d")
     
-    # 日付ごとにメッセージをグループ化
-    if date_str not in daily_messages:
-        daily_messages[date_str] = []
-    
-    # メッセージ情報を保存
-    message_data = {
-        'timestamp': message.created_at.astimezone(JST),
-        'author': message.author.display_name,
-        'content': message.content,
-        'message_id': message.id
-    }
-    
-    daily_messages[date_str].append(message_data)
-    print(f"📝 メッセージをメモリに追加: {date_str} - {message.author.display_name}")
-
-def get_available_dates():
-    """利用可能な日付の一覧を取得"""
-    return sorted(daily_messages.keys(), reverse=True)
-
-async def auto_generate_and_send(channel, message):
-    """メッセージ投稿のたびにマークダウンファイルを自動生成して送信"""
-    try:
-        # 日本時間での日付と時刻を取得
-        jst_datetime = message.created_at.astimezone(JST)
-        date_str = jst_datetime.strftime("%Y-%m-%d")
-        time_str = jst_datetime.strftime("%H%M%S")
-        
-        if date_str not in daily_messages or not daily_messages[date_str]:
-            return
-        
-        # マークダウンコンテンツを生成
-        content = generate_markdown_content(date_str)
-        
-        # バイトストリームとして準備
-        content_bytes = content.encode('utf-8')
-        file_data = io.BytesIO(content_bytes)
-        file_data.seek(0)
-        
-        # ファイル名に日付と時刻を含める
-        filename = f"{date_str}_{time_str}.md"
-        discord_file = discord.File(file_data, filename=filename)
-        
-        # 簡潔なメッセージで送信
-        message_count = len(daily_messages[date_str])
-        await channel.send(f"📄 **{date_str}** のマークダウンファイルを生成しました ({message_count}件のメッセージ)", file=discord_file)
-        
-        print(f"🤖 自動生成完了: {filename} ({message_count}件)")
-        
-    except Exception as e:
-        print(f"❌ 自動生成エラー: {e}")
-        await channel.send(f"❌ マークダウンファイルの生成に失敗しました: {str(e)}")
-
-def generate_markdown_content(date_str):
-    """指定日のメッセージからマークダウンコンテンツを生成"""
-    if date_str not in daily_messages or not daily_messages[date_str]:
-        return f"# {date_str}\n\nこの日のメッセージはありません。"
-    
-    messages = daily_messages[date_str]
-    
-    # マークダウンコンテンツを生成
-    content = f"# {date_str}\n\n"
-    content += f"## 📋 Discord Messages ({len(messages)} 件)\n\n"
-    
-    for msg in messages:
-        timestamp = msg['timestamp'].strftime("%H:%M")
-        author = sanitize_content(msg['author'][:50])
-        message_content = sanitize_content(msg['content'])
-        
-        content += f"**{timestamp}** *{author}*: {message_content}\n\n"
-    
-    return content
+    # メッセージ情報を保存（StoredMessage として保持する）
+    message_data = message_store.add(
+        date_str, message.id, message.created_at, message.author.display_name, message.content
+    )
+    # キャッシュ済みの日なら、この1件の行だけを整形して追記する
+    note = note_cache.get(date_str)
+    if note is not None and not note.append(message_data):
+        # 古いメッセージが後から来たら、次に使うときに時刻順で作り直す
+        note_cache.discard(date_str)
+    if vault_sink is not None:
+        vault_sink.append(date_str, message_data)
+    logger.debug("📝 メッセージを保存: %s - %s", date_str, message.author.display_name)
+    return date_str
+
+def edit_message_in_memory(message_id, content):
+    """保存済みメッセージの本文を更新（対象の日付を返す。保存していなければ None）"""
+    date_str = message_store.edit(message_id, content)
+    if date_str is not None:
+        # その日のノートだけ作り直す
+        note_cache.discard(date_str)
+        if vault_sink is not None:
+            vault_sink.rewrite(date_str)
+    return date_str
+
+def delete_message_from_memory(message_id):
+    """保存済みメッセージを削除（対象の日付を返す。保存していなければ None）"""
+    date_str = message_store.delete(message_id)
+    if date_str is not None:
+        note_cache.discard(date_str)
+        if vault_sink is not None:
+            vault_sink.rewrite(date_str)
+    return date_str
+
+def get_available_dates(limit=None):
+    """利用可能な日付の一覧を取得（新しい順）"""
+    return message_store.dates(limit)
+
+class DayNote:
+    """1日分のマークダウンの本文（メッセージ毎の行をUTF-8で追記していく）"""
+
+    __slots__ = ('lines', 'chars', 'last_key')
+
+    def __init__(self):
+        self.lines = []       # 整形・サニタイズ済みの行（bytes）
+        self.chars = 0        # 本文の文字数
+        self.last_key = None  # 最後の行のメッセージの並び順
+
+    def append(self, msg):
+        """メッセージ1件分の行を末尾に追加（時刻順で末尾に来ない場合は False）"""
+        key = message_sort_key(msg)
+        if self.last_key is not None and key < self.last_key:
+            return False
+        line = render_message_line(msg)
+        self.lines.append(line.encode('utf-8'))
+        self.chars += len(line)
+        self.last_key = key
+        return True
+
+    def __len__(self):
+        return len(self.lines)
+
+
+def message_time(msg):
+    """日本時間の時:分（UNIX時刻から直接求める）"""
+    seconds = (msg.timestamp + JST_OFFSET) % 86400
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}"
+
+def render_message_line(msg):
+    """メッセージ1件分のマークダウンの行"""
+    timestamp = message_time(msg)
+    author = sanitize_content(msg.author[:50])
+    message_content = sanitize_content(msg.content)
+    return f"**{timestamp}** *{author}*: {message_content}\n\n"
+
+def markdown_header(date_str, message_count):
+    return f"# {date_str}\n\n## 📋 Discord Messages ({message_count} 件)\n\n"
+
+def get_day_note(date_str):
+    """指定日の DayNote（キャッシュになければ保存先から1回だけ整形する）"""
+    note = note_cache.get(date_str)
+    if note is None:
+        note = DayNote()
+        for msg in message_store.messages(date_str):
+            note.append(msg)
+        note_cache.put(date_str, note)
+    return note
+
+@timed('generate_markdown_bytes')
+def generate_markdown_bytes(date_str):
+    """指定日のマークダウンファイルの中身（UTF-8）
+
+    メッセージの行は整形済みのものを連結するだけなので、再サニタイズや再エンコードはしない。
+    """
+    note = get_day_note(date_str)
+    if not note:
+        return f"# {date_str}\n\nこの日のメッセージはありません。".encode('utf-8')
+    return markdown_header(date_str, len(note)).encode('utf-8') + b''.join(note.lines)
+
+def note_file(date_str, filename):
+    """指定日のマークダウンファイルの添付"""
+    return discord.File(io.BytesIO(generate_markdown_bytes(date_str)), filename=filename)
+
+def vault_header(date_str):
+    # 追記していくので、件数は見出しに入れない
+    return f"# {date_str}\n\n## 📋 Discord Messages\n\n"
+
+def render_vault_note(date_str):
+    """Vaultに書く1日分のファイルの中身と、最後のメッセージの並び順"""
+    note = get_day_note(date_str)
+    return vault_header(date_str).encode('utf-8') + b''.join(note.lines), note.last_key
+
+async def flush_vault():
+    if vault_sink is not None:
+        await vault_sink.flush(render_vault_note, render_message_line)
+
+def parse_date_option(value):
+    """コマンドで指定された日付（YYYY-MM-DD）を検証する（不正なら ValueError）"""
+    if value is None:
+        return None
+    datetime.strptime(value, "%Y-%m-%d")
+    return value
+
+def format_search_result(msg, query):
+    """検索結果1件の抜粋（一致した部分を太字にする）"""
+    snippet, span = make_snippet(msg.content, query)
+    if span is None:
+        return discord.utils.escape_markdown(snippet)
+    start, end = span
+    return (discord.utils.escape_markdown(snippet[:start])
+            + f"**{discord.utils.escape_markdown(snippet[start:end])}**"
+            + discord.utils.escape_markdown(snippet[end:]))
 
 def sanitize_content(content):
     """コンテンツをサニタイズ"""
@@ -117,219 +241,546 @@ def sanitize_content(content):
 
 
 
-@bot.event
-async def on_ready():
-    print(f'{bot.user}としてログインしました！(ObsidianBot)')
-    print(f'監視チャンネルID: {OBSIDIAN_CHANNEL_ID}')
-    try:
-        synced = await bot.tree.sync()
-        print(f'{len(synced)}個のスラッシュコマンドを同期しました')
-    except Exception as e:
-        print(f'スラッシュコマンドの同期に失敗しました: {e}')
-    
-    print('📝 Discordメッセージ収集機能を開始しました')
+class ObsidianCog(commands.Cog):
+    """Obsidianノート機能（メッセージ収集・マークダウン生成）
 
-@bot.event
-async def on_message(message):
-    print(f"🔥 on_message呼び出し - 作者: {message.author}")
-    
-    if message.author == bot.user:
-        print(f"🤖 bot自身のメッセージなのでスキップ")
-        return
-    
-    print(f"📋 ギルドID確認 - 受信: {message.guild.id if message.guild else 'なし'}, 期待: {ALLOWED_GUILD_ID}")
-    if message.guild.id != ALLOWED_GUILD_ID:
-        print(f"❌ ギルドID不一致のためスキップ")
-        return
-    
-    print(f"✅ メッセージ受信 - チャンネルID: {message.channel.id}, 作者: {message.author.display_name}, 内容: {message.content}")
-    
-    # 指定されたチャンネルの投稿をメモリに保存
-    if message.channel.id == OBSIDIAN_CHANNEL_ID:
-        print(f"✅ 対象チャンネル一致！メモリに保存...")
+    送信キューはBot（bot_base.SharedBot）のものを使う。
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.export_scheduler = ExportScheduler(self.export_note, EXPORT_POLICY)
+        self.export_channel = None           # 最後にメッセージを受け取った監視チャンネル
+        self.export_messages = LRUCache(OBSIDIAN_RECENT_DAYS)  # {date_str: ノートを載せたメッセージ}（edit のとき）
+        self.pinned_message = None
+        self.backfill_task = None
+        # 取り込み済みの履歴と受信中のメッセージが途切れずにつながっているか
+        # （履歴の取り込みが終わっていて、その後切断されていない）
+        self.history_synced = False
+        self.connected = False
+        self.saved_checkpoint = None
+
+    async def cog_load(self):
+        message_store.open()
+        if not self.flush_messages.is_running():
+            self.flush_messages.start()
+        if not self.midnight_export.is_running():
+            self.midnight_export.start()
+        if vault_sink is not None and not self.write_vault.is_running():
+            self.write_vault.start()
+        self.export_scheduler.start()
+
+    async def cog_unload(self):
+        self.flush_messages.cancel()
+        self.midnight_export.cancel()
+        self.write_vault.cancel()
+        if self.backfill_task is not None:
+            self.backfill_task.cancel()
+        self.save_history_checkpoint()
+        # 未出力のノートを送信キューに積む（キューはこの後 SharedBot.close で送り切る）
+        await self.export_scheduler.close()
+        await flush_vault()
+        # 未保存のメッセージを書き出してから閉じる
+        message_store.close()
+
+    @tasks.loop(seconds=OBSIDIAN_FLUSH_INTERVAL)
+    async def flush_messages(self):
+        """投稿が途切れても未保存のメッセージが残らないよう定期的に書き出す"""
+        message_store.flush()
+        self.save_history_checkpoint()
+
+    @property
+    def history_caught_up(self):
+        return self.history_synced and self.connected
+
+    def save_history_checkpoint(self):
+        """受信中のメッセージまで欠けずに保存できていれば、取り込みの記録を進める"""
+        if not self.history_caught_up:
+            return
+        last_id = message_store.last_message_id
+        if last_id is not None and last_id != self.saved_checkpoint:
+            message_store.flush()
+            message_store.set_checkpoint(HISTORY_CHECKPOINT, last_id)
+            self.saved_checkpoint = last_id
+
+    async def backfill_history(self):
+        """停止中・切断中に投稿されたメッセージを履歴から取り込む
+
+        記録したメッセージIDの後から OBSIDIAN_BACKFILL_PAGE_SIZE 件ずつ古い順に読み、
+        ページ毎に保存して記録を進める（途中で止まっても次回はその続きから読む）。
+        取り込んだメッセージでは自動出力しない。
+        """
+        self.history_synced = False
+        channel = self.bot.get_channel(OBSIDIAN_CHANNEL_ID)
+        if channel is None:
+            logger.warning("⚠️ 監視チャンネルが見つからないため履歴を取り込めません: %s", OBSIDIAN_CHANNEL_ID)
+            return
+
+        after_id = message_store.checkpoint(HISTORY_CHECKPOINT) or message_store.last_message_id
+        if after_id is not None:
+            after = discord.Object(id=after_id)
+        else:
+            after = datetime.now(timezone.utc) - timedelta(days=OBSIDIAN_BACKFILL_MAX_DAYS)
+        # これより後のメッセージは on_message で受け取る
+        before = discord.Object(id=discord.utils.time_snowflake(datetime.now(timezone.utc), high=True))
+
+        added = 0
         try:
-            # メッセージをメモリに保存
-            add_message_to_memory(message)
-            print(f"✅ メモリ保存完了")
-            
-            # 自動でマークダウンファイルを生成して送信
-            await auto_generate_and_send(message.channel, message)
-            
+            while True:
+                page = [m async for m in channel.history(limit=OBSIDIAN_BACKFILL_PAGE_SIZE, after=after,
+                                                         before=before, oldest_first=True)]
+                if not page:
+                    break
+                # on_message で受け取り済みのものは除く
+                known = message_store.known_ids(m.id for m in page)
+                for message in page:
+                    if message.id not in known and message.author != self.bot.user:
+                        add_message_to_memory(message)
+                        added += 1
+                message_store.flush()
+                message_store.set_checkpoint(HISTORY_CHECKPOINT, page[-1].id)
+                after = page[-1]
+                if len(page) < OBSIDIAN_BACKFILL_PAGE_SIZE:
+                    break
+                # APIの制限に余裕を残すため、ページ毎に間を空ける
+                await asyncio.sleep(OBSIDIAN_BACKFILL_DELAY)
+        except discord.HTTPException as e:
+            # 記録した所までは保存済み。次の on_ready で続きから読む
+            logger.error("❌ 履歴の取り込みに失敗しました（%d件取り込み済み）: %s", added, e)
+            return
+
+        self.history_synced = True
+        self.save_history_checkpoint()
+        if added:
+            logger.info("📥 停止中のメッセージを%d件取り込みました", added)
+
+    @tasks.loop(time=time(hour=0, minute=0, tzinfo=JST))
+    async def midnight_export(self):
+        """日付が変わったら前日分の未出力のノートを出力する"""
+        await self.export_scheduler.flush()
+        await flush_vault()
+
+    @tasks.loop(seconds=OBSIDIAN_VAULT_FLUSH_INTERVAL)
+    async def write_vault(self):
+        """溜まった追記・作り直しをVaultにまとめて書き出す"""
+        await flush_vault()
+
+    @timed('export_note')
+    async def export_note(self, date_str, pending_count):
+        """指定日のマークダウンファイルを出力（ExportScheduler からまとめて呼ばれる）"""
+        channel = self.export_channel
+        message_count = message_store.count(date_str)
+        if channel is None or not message_count:
+            return
+
+        content = f"📄 **{date_str}** のマークダウンファイルを生成しました ({message_count}件のメッセージ)"
+        try:
+            if OBSIDIAN_EXPORT_MODE == 'edit':
+                await self.update_daily_message(channel, date_str, content)
+            else:
+                # ファイル名に日付と時刻を含める
+                filename = f"{date_str}_{datetime.now(JST).strftime('%H%M%S')}.md"
+                self.bot.outbound.send(channel, content, file=note_file(date_str, filename), priority=PRIORITY_REPLY)
+            NOTE_EXPORTS.inc(mode=OBSIDIAN_EXPORT_MODE)
+            logger.info("🤖 自動生成完了: %s (%d件、前回から%d件)", date_str, message_count, pending_count)
+
         except Exception as e:
-            print(f"❌ メモリ保存・自動生成エラー: {e}")
-    else:
-        print(f"チャンネルID不一致 - 受信: {message.channel.id}, 期待: {OBSIDIAN_CHANNEL_ID}")
-    
-    await bot.process_commands(message)
-
-@bot.tree.command(name='obsidian_status', description='メッセージ収集の状態を確認します')
-async def obsidian_status(interaction: discord.Interaction):
-    """メッセージ収集の現在の状態を表示"""
-    if interaction.guild.id != ALLOWED_GUILD_ID:
-        await interaction.response.send_message("このコマンドは指定されたサーバーでのみ使用できます。", ephemeral=True)
-        return
-    
-    today = datetime.now(JST).strftime("%Y-%m-%d")
-    today_count = len(daily_messages.get(today, []))
-    
-    embed = discord.Embed(
-        title="📝 メッセージ収集状態",
-        color=0x9f7aea
-    )
-    
-    embed.add_field(
-        name="監視チャンネル",
-        value=f"<#{OBSIDIAN_CHANNEL_ID}>",
-        inline=False
-    )
-    
-    embed.add_field(
-        name="今日の収集メッセージ数",
-        value=f"{today_count} 件",
-        inline=False
-    )
-    
-    embed.add_field(
-        name="総収集日数",
-        value=f"{len(daily_messages)} 日",
-        inline=False
-    )
-    
-    available_dates = get_available_dates()
-    if available_dates:
-        recent_dates = available_dates[:5]
-        dates_list = []
-        for date in recent_dates:
-            count = len(daily_messages[date])
-            dates_list.append(f"`{date}` ({count}件)")
-        
-        embed.add_field(
-            name="最近の収集日",
-            value="\n".join(dates_list),
-            inline=False
-        )
-    
-    await interaction.response.send_message(embed=embed)
-
-@bot.tree.command(name='download_note', description='指定した日付のメッセージをマークダウンファイルでダウンロード')
-async def download_note(interaction: discord.Interaction, date: str = None):
-    """指定日のメッセージをマークダウンファイルとして送信"""
-    if interaction.guild.id != ALLOWED_GUILD_ID:
-        await interaction.response.send_message("このコマンドは指定されたサーバーでのみ使用できます。", ephemeral=True)
-        return
-    
-    # 日付が指定されていない場合は今日の日付を使用
-    if date is None:
-        target_date = datetime.now(JST).strftime("%Y-%m-%d")
-    else:
+            logger.exception("❌ 自動生成エラー: %s", e)
+            self.bot.outbound.send(channel, f"❌ マークダウンファイルの生成に失敗しました: {str(e)}")
+
+    async def update_daily_message(self, channel, date_str, content):
+        """その日のノートを載せたメッセージの添付ファイルを差し替える（なければ送ってピン留めする）"""
+        filename = f"{date_str}.md"
+        message = self.export_messages.get(date_str)
+        if message is None:
+            # 再起動前に送ったメッセージがあればそれを使う
+            saved = message_store.export_message(date_str)
+            if saved is not None and saved[0] == channel.id:
+                try:
+                    message = await channel.fetch_message(saved[1])
+                except discord.HTTPException:
+                    message = None
+
+        if message is not None:
+            try:
+                await message.edit(content=content, attachments=[note_file(date_str, filename)])
+                self.export_messages.put(date_str, message)
+                return
+            except discord.NotFound:
+                logger.info("📌 %s のノートのメッセージが削除されていたため送り直します", date_str)
+
+        message = await self.bot.outbound.send(channel, content, file=note_file(date_str, filename),
+                                               priority=PRIORITY_REPLY)
+        if message is None:
+            return
+        self.export_messages.put(date_str, message)
+        message_store.set_export_message(date_str, channel.id, message.id)
+
+        # ピン留めは最新の日のメッセージだけにする
         try:
-            # 日付形式の検証
-            datetime.strptime(date, "%Y-%m-%d")
-            target_date = date
-        except ValueError:
-            await interaction.response.send_message("❌ 日付形式が正しくありません。YYYY-MM-DD形式で入力してください。", ephemeral=True)
+            if self.pinned_message is not None and self.pinned_message.id != message.id:
+                await self.pinned_message.unpin()
+            await message.pin()
+            self.pinned_message = message
+        except discord.HTTPException as e:
+            logger.warning("📌 ピン留めに失敗しました: %s", e)
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        logger.info('%sとしてログインしました！(ObsidianBot)', self.bot.user)
+        logger.info('監視チャンネルID: %s', OBSIDIAN_CHANNEL_ID)
+        logger.info('📝 Discordメッセージ収集機能を開始しました')
+        # 起動時と、再開できない再接続のたびに、受け取れなかったメッセージを取り込む
+        self.connected = True
+        if OBSIDIAN_BACKFILL_ENABLED and (self.backfill_task is None or self.backfill_task.done()):
+            self.backfill_task = asyncio.create_task(self.backfill_history())
+
+    @commands.Cog.listener()
+    async def on_disconnect(self):
+        # 切断中のメッセージは再接続後の取り込みで補うまで記録を進めない
+        self.connected = False
+
+    @commands.Cog.listener()
+    async def on_resumed(self):
+        # 再開できた場合は切断中のイベントも届く
+        self.connected = True
+
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        if message.author == self.bot.user:
             return
-    
-    try:
-        # 指定日のメッセージが存在するかチェック
-        if target_date not in daily_messages or not daily_messages[target_date]:
-            await interaction.response.send_message(f"❌ {target_date} のメッセージが見つかりません。", ephemeral=True)
+
+        if message.guild is None or message.guild.id != ALLOWED_GUILD_ID:
             return
-        
-        # マークダウンコンテンツを生成
-        content = generate_markdown_content(target_date)
-        
-        # セキュリティ: ファイルサイズ制限 (Discordの上限は25MB)
-        MAX_FILE_SIZE = 24 * 1024 * 1024  # 24MB
-        content_bytes = content.encode('utf-8')
-        
-        if len(content_bytes) > MAX_FILE_SIZE:
-            await interaction.response.send_message(f"❌ ファイルサイズが大きすぎます ({len(content_bytes)/1024/1024:.1f}MB)。25MB以下にしてください。", ephemeral=True)
+
+        # DEBUGログはサンプリングしたイベントだけ整形・出力する
+        trace = sample_event(logger)
+        if trace:
+            logger.debug("メッセージ受信 - チャンネルID: %s, 作者: %s, 内容: %s",
+                         message.channel.id, message.author.display_name, message.content)
+
+        # 指定されたチャンネルの投稿をメモリに保存
+        if message.channel.id == OBSIDIAN_CHANNEL_ID:
+            try:
+                # メッセージをメモリに保存
+                date_str = add_message_to_memory(message)
+
+                # マークダウンファイルの出力はまとめて行う（ExportScheduler）
+                if date_str is not None:
+                    self.export_channel = message.channel
+                    self.export_scheduler.notify(date_str)
+
+            except Exception as e:
+                logger.exception("❌ メモリ保存・自動生成エラー: %s", e)
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload):
+        # 本文が変わった場合だけ反映する（埋め込みの展開などは本文が同じなので edit() が None を返す）
+        if payload.channel_id != OBSIDIAN_CHANNEL_ID or 'content' not in payload.data:
             return
-        
-        # バイトストリームとして準備
-        file_data = io.BytesIO(content_bytes)
-        file_data.seek(0)
-        
-        # Discordファイルオブジェクトを作成
-        discord_file = discord.File(file_data, filename=f"{target_date}.md")
-        
-        # 埋め込みメッセージを作成
-        message_count = len(daily_messages[target_date])
+        # Bot自身のメッセージ（ノートの出力など）は保存していない
+        author_id = payload.data.get('author', {}).get('id')
+        if author_id is not None and int(author_id) == self.bot.user.id:
+            return
+        date_str = edit_message_in_memory(payload.message_id, payload.data['content'])
+        if date_str is not None:
+            self.export_scheduler.notify(date_str)
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload):
+        if payload.channel_id != OBSIDIAN_CHANNEL_ID:
+            return
+        date_str = delete_message_from_memory(payload.message_id)
+        if date_str is not None:
+            self.export_scheduler.notify(date_str)
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload):
+        if payload.channel_id != OBSIDIAN_CHANNEL_ID:
+            return
+        dates = {delete_message_from_memory(message_id) for message_id in payload.message_ids}
+        for date_str in sorted(dates - {None}):
+            self.export_scheduler.notify(date_str)
+
+    @app_commands.command(name='obsidian_status', description='メッセージ収集の状態を確認します')
+    @timed('command:obsidian_status')
+    async def obsidian_status(self, interaction: discord.Interaction):
+        """メッセージ収集の現在の状態を表示"""
+        if interaction.guild.id != ALLOWED_GUILD_ID:
+            await interaction.response.send_message("このコマンドは指定されたサーバーでのみ使用できます。", ephemeral=True)
+            return
+
+        today = datetime.now(JST).strftime("%Y-%m-%d")
+        today_count = message_store.count(today)
+
         embed = discord.Embed(
-            title="📄 メッセージダウンロード",
-            description=f"**{target_date}** のメッセージです",
-            color=0x00ff88
+            title="📝 メッセージ収集状態",
+            color=0x9f7aea
         )
-        
+
         embed.add_field(
-            name="📊 統計",
-            value=f"メッセージ数: {message_count} 件\n文字数: {len(content)} 文字",
+            name="監視チャンネル",
+            value=f"<#{OBSIDIAN_CHANNEL_ID}>",
             inline=False
         )
-        
+
         embed.add_field(
-            name="💾 使用方法",
-            value="添付ファイルをダウンロードしてObsidianにインポートしてください",
+            name="今日の収集メッセージ数",
+            value=f"{today_count} 件",
             inline=False
         )
-        
-        await interaction.response.send_message(embed=embed, file=discord_file)
-        
-        print(f"📤 {target_date}.md をDiscordに送信しました ({message_count}件のメッセージ)")
-        
-    except Exception as e:
-        await interaction.response.send_message(f"❌ ファイル送信エラー: {str(e)}", ephemeral=True)
-        print(f"❌ ファイル送信エラー: {e}")
-
-@bot.tree.command(name='list_notes', description='収集済みメッセージの一覧を表示')
-async def list_notes(interaction: discord.Interaction):
-    """収集済みメッセージの一覧を表示"""
-    if interaction.guild.id != ALLOWED_GUILD_ID:
-        await interaction.response.send_message("このコマンドは指定されたサーバーでのみ使用できます。", ephemeral=True)
-        return
-    
-    try:
-        if not daily_messages:
-            await interaction.response.send_message("📝 まだメッセージが収集されていません。", ephemeral=True)
-            return
-        
-        # 埋め込みメッセージを作成
-        embed = discord.Embed(
-            title="📋 収集済みメッセージ一覧",
-            description=f"収集されているメッセージ: {len(daily_messages)} 日分",
-            color=0x9f7aea
-        )
-        
-        # 最新の10件を表示
-        available_dates = get_available_dates()
-        recent_dates = available_dates[:10]
-        note_list = []
-        for date in recent_dates:
-            count = len(daily_messages[date])
-            note_list.append(f"📄 `{date}` ({count}件)")
-        
+
         embed.add_field(
-            name="🕒 最新の収集日",
-            value="\n".join(note_list) if note_list else "なし",
+            name="総収集日数",
+            value=f"{message_store.day_count} 日",
             inline=False
         )
-        
+
+        recent_dates = get_available_dates(limit=5)
+        if recent_dates:
+            dates_list = []
+            for date in recent_dates:
+                count = message_store.count(date)
+                dates_list.append(f"`{date}` ({count}件)")
+
+            embed.add_field(
+                name="最近の収集日",
+                value="\n".join(dates_list),
+                inline=False
+            )
+
         embed.add_field(
-            name="💡 使用方法",
-            value="`/download_note YYYY-MM-DD` でマークダウンファイルをダウンロード\n`/download_note` で今日のメッセージをダウンロード",
+            name="📈 パフォーマンス",
+            value=f"保存メッセージ数: {message_store.total} 件 (メモリ上 {message_store.cached_count} 件)\n"
+                  f"未出力のメッセージ: {self.export_scheduler.pending_total} 件\n"
+                  + format_summary(),
             inline=False
         )
-        
+
         await interaction.response.send_message(embed=embed)
-        
-    except Exception as e:
-        await interaction.response.send_message(f"❌ 一覧取得エラー: {str(e)}", ephemeral=True)
-        print(f"❌ 一覧取得エラー: {e}")
+
+    @app_commands.command(name='download_note', description='指定した日付のメッセージをマークダウンファイルでダウンロード')
+    @timed('command:download_note')
+    async def download_note(self, interaction: discord.Interaction, date: str = None):
+        """指定日のメッセージをマークダウンファイルとして送信"""
+        if interaction.guild.id != ALLOWED_GUILD_ID:
+            await interaction.response.send_message("このコマンドは指定されたサーバーでのみ使用できます。", ephemeral=True)
+            return
+
+        # 日付が指定されていない場合は今日の日付を使用
+        if date is None:
+            target_date = datetime.now(JST).strftime("%Y-%m-%d")
+        else:
+            try:
+                # 日付形式の検証
+                datetime.strptime(date, "%Y-%m-%d")
+                target_date = date
+            except ValueError:
+                await interaction.response.send_message("❌ 日付形式が正しくありません。YYYY-MM-DD形式で入力してください。", ephemeral=True)
+                return
+
+        try:
+            # 指定日のメッセージが存在するかチェック
+            if not message_store.count(target_date):
+                await interaction.response.send_message(f"❌ {target_date} のメッセージが見つかりません。", ephemeral=True)
+                return
+
+            # マークダウンコンテンツを生成（自動生成と同じキャッシュを使う）
+            content_bytes = generate_markdown_bytes(target_date)
+
+            # セキュリティ: ファイルサイズ制限 (Discordの上限は25MB)
+            MAX_FILE_SIZE = 24 * 1024 * 1024  # 24MB
+            if len(content_bytes) > MAX_FILE_SIZE:
+                await interaction.response.send_message(f"❌ ファイルサイズが大きすぎます ({len(content_bytes)/1024/1024:.1f}MB)。25MB以下にしてください。", ephemeral=True)
+                return
+
+            # バイトストリームとして準備
+            file_data = io.BytesIO(content_bytes)
+            file_data.seek(0)
+
+            # Discordファイルオブジェクトを作成
+            discord_file = discord.File(file_data, filename=f"{target_date}.md")
+
+            # 埋め込みメッセージを作成
+            message_count = message_store.count(target_date)
+            char_count = len(markdown_header(target_date, message_count)) + get_day_note(target_date).chars
+            embed = discord.Embed(
+                title="📄 メッセージダウンロード",
+                description=f"**{target_date}** のメッセージです",
+                color=0x00ff88
+            )
+
+            embed.add_field(
+                name="📊 統計",
+                value=f"メッセージ数: {message_count} 件\n文字数: {char_count} 文字",
+                inline=False
+            )
+
+            embed.add_field(
+                name="💾 使用方法",
+                value="添付ファイルをダウンロードしてObsidianにインポートしてください",
+                inline=False
+            )
+
+            await interaction.response.send_message(embed=embed, file=discord_file)
+
+            logger.info("📤 %s.md をDiscordに送信しました (%d件のメッセージ)", target_date, message_count)
+
+        except Exception as e:
+            await interaction.response.send_message(f"❌ ファイル送信エラー: {str(e)}", ephemeral=True)
+            logger.exception("❌ ファイル送信エラー: %s", e)
+
+    @app_commands.command(name='list_notes', description='収集済みメッセージの一覧を表示')
+    @timed('command:list_notes')
+    async def list_notes(self, interaction: discord.Interaction):
+        """収集済みメッセージの一覧を表示"""
+        if interaction.guild.id != ALLOWED_GUILD_ID:
+            await interaction.response.send_message("このコマンドは指定されたサーバーでのみ使用できます。", ephemeral=True)
+            return
+
+        try:
+            if not message_store.day_count:
+                await interaction.response.send_message("📝 まだメッセージが収集されていません。", ephemeral=True)
+                return
+
+            # 埋め込みメッセージを作成
+            embed = discord.Embed(
+                title="📋 収集済みメッセージ一覧",
+                description=f"収集されているメッセージ: {message_store.day_count} 日分",
+                color=0x9f7aea
+            )
+
+            # 最新の10件を表示
+            recent_dates = get_available_dates(limit=10)
+            note_list = []
+            for date in recent_dates:
+                count = message_store.count(date)
+                note_list.append(f"📄 `{date}` ({count}件)")
+
+            embed.add_field(
+                name="🕒 最新の収集日",
+                value="\n".join(note_list) if note_list else "なし",
+                inline=False
+            )
+
+            embed.add_field(
+                name="💡 使用方法",
+                value="`/download_note YYYY-MM-DD` でマークダウンファイルをダウンロード\n`/download_note` で今日のメッセージをダウンロード",
+                inline=False
+            )
+
+            await interaction.response.send_message(embed=embed)
+
+        except Exception as e:
+            await interaction.response.send_message(f"❌ 一覧取得エラー: {str(e)}", ephemeral=True)
+            logger.exception("❌ 一覧取得エラー: %s", e)
+
+    @app_commands.command(name='search_notes', description='収集済みメッセージを全文検索します（投稿者・期間で絞り込み可）')
+    @timed('command:search_notes')
+    async def search_notes(self, interaction: discord.Interaction, query: str, author: str = None,
+                           start: str = None, end: str = None):
+        """収集済みメッセージを検索し、関連度の高い順に抜粋を表示"""
+        if interaction.guild.id != ALLOWED_GUILD_ID:
+            await interaction.response.send_message("このコマンドは指定されたサーバーでのみ使用できます。", ephemeral=True)
+            return
+
+        try:
+            start_date = parse_date_option(start)
+            end_date = parse_date_option(end)
+        except ValueError:
+            await interaction.response.send_message("❌ 日付形式が正しくありません。YYYY-MM-DD形式で入力してください。", ephemeral=True)
+            return
+
+        try:
+            results = message_store.search(query, author=author, start=start_date, end=end_date,
+                                           limit=SEARCH_RESULT_LIMIT)
+            if not results:
+                await interaction.response.send_message(f"🔎 「{query}」に一致するメッセージは見つかりませんでした。", ephemeral=True)
+                return
+
+            embed = discord.Embed(
+                title="🔎 メッセージ検索",
+                description=f"「{discord.utils.escape_markdown(query)}」の検索結果（上位{len(results)}件）",
+                color=0x9f7aea
+            )
+            for date_str, msg in results:
+                embed.add_field(
+                    name=f"📄 {date_str} {message_time(msg)} {msg.author[:50]}",
+                    value=format_search_result(msg, query)[:1024],
+                    inline=False
+                )
+
+            await interaction.response.send_message(embed=embed)
+
+        except Exception as e:
+            await interaction.response.send_message(f"❌ 検索エラー: {str(e)}", ephemeral=True)
+            logger.exception("❌ 検索エラー: %s", e)
+
+    @app_commands.command(name='export_notes', description='指定した期間のノートを1日1ファイルのzipでダウンロード')
+    @timed('command:export_notes')
+    async def export_notes(self, interaction: discord.Interaction, start: str, end: str = None):
+        """start〜end（省略時は start の1日）のノートを zip にまとめて送信"""
+        if interaction.guild.id != ALLOWED_GUILD_ID:
+            await interaction.response.send_message("このコマンドは指定されたサーバーでのみ使用できます。", ephemeral=True)
+            return
+
+        try:
+            start_date = parse_date_option(start)
+            end_date = parse_date_option(end) or start_date
+        except ValueError:
+            await interaction.response.send_message("❌ 日付形式が正しくありません。YYYY-MM-DD形式で入力してください。", ephemeral=True)
+            return
+        if start_date > end_date:
+            start_date, end_date = end_date, start_date
+        days = (datetime.strptime(end_date, "%Y-%m-%d") - datetime.strptime(start_date, "%Y-%m-%d")).days + 1
+        if days > EXPORT_MAX_DAYS:
+            await interaction.response.send_message(f"❌ 一度に出力できるのは{EXPORT_MAX_DAYS}日分までです。", ephemeral=True)
+            return
+
+        counts = {date: message_store.count(date) for date in message_store.dates() if start_date <= date <= end_date}
+        if not counts:
+            await interaction.response.send_message(f"❌ {start_date}〜{end_date} のメッセージが見つかりません。", ephemeral=True)
+            return
+
+        # 圧縮には時間がかかるので先に応答しておく。公開で defer すると後続の ephemeral が
+        # 無視されてエラーまで公開されるため、結果も含めて本人にだけ表示する
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        try:
+            # ワーカースレッドでDBを読むので、未保存の分を先に書き出す
+            message_store.flush()
+            limit = min(ATTACHMENT_LIMIT, interaction.guild.filesize_limit)
+            with tempfile.TemporaryDirectory(prefix='obsidian_export_') as directory:
+                paths = await asyncio.to_thread(
+                    write_note_archives, message_store.path, counts, render_message_line, markdown_header,
+                    limit, directory, 'obsidian',
+                )
+                for index, path in enumerate(paths, 1):
+                    part = f" ({index}/{len(paths)})" if len(paths) > 1 else ""
+                    await interaction.followup.send(
+                        f"🗂️ **{start_date}〜{end_date}** のノート{part}",
+                        file=discord.File(path, filename=os.path.basename(path)),
+                        ephemeral=True,
+                    )
+
+            logger.info("📤 %s〜%s のノートを%d個のzipで送信しました (%d日分)", start_date, end_date, len(paths), len(counts))
+
+        except NoteTooLarge as e:
+            await interaction.followup.send(f"❌ {e} のノートは1日分だけで添付ファイルの上限を超えるため出力できません。", ephemeral=True)
+        except Exception as e:
+            await interaction.followup.send(f"❌ ファイル送信エラー: {str(e)}", ephemeral=True)
+            logger.exception("❌ まとめ出力エラー: %s", e)
+
+
+async def setup(bot):
+    """拡張として読み込むときの入口（bot_main.py から使う）"""
+    await bot.add_cog(ObsidianCog(bot))
+
 
 if __name__ == '__main__':
+    setup_logging()
     token = os.getenv('DISCORD_TOKEN_OBSIDIAN')
     if token:
-        bot.run(token)
+        # discord.py のログもキュー経由の共通設定で出力する
+        SharedBot(cogs=[ObsidianCog]).run(token, log_handler=None)
     else:
-        print('DISCORD_TOKEN_OBSIDIANが設定されていません。.env.obsidianファイルを確認してください。')
\ No newline at end of file
+        logger.error('DISCORD_TOKEN_OBSIDIANが設定されていません。.env.obsidianファイルを確認してください。')
\ No newline at end of file
@@ -0,0 +1,181 @@
+"""Bot共通の送信キュー
+
+イベントハンドラから `channel.send` を直接呼ぶ代わりにここへ積む。
+
+- 優先度レーン: 定期配信 > ユーザーへの返信 > エコー・リアクション通知
+- チャンネル毎の送信レートを手元で管理し、上限に達したら待ってから送る
+- 2000文字を超える本文は行単位で分割する
+- 同じチャンネル・同じレーンで待っている短いメッセージは1通にまとめる
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+from collections import deque
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Discordの1メッセージあたりの文字数上限
+DISCORD_MESSAGE_LIMIT = 2000
+
+# 優先度レーン（小さいほど先に送る）
+PRIORITY_DIGEST = 0
+PRIORITY_REPLY = 1
+PRIORITY_CHATTER = 2
+
+# チャンネル毎の送信レート（Discordの制限より少し控えめに）
+CHANNEL_RATE_LIMIT = 5      # CHANNEL_RATE_PERIOD 秒あたりの送信数
+CHANNEL_RATE_PERIOD = 5.5
+
+# 終了時に残りの送信を待つ時間（秒）
+DRAIN_TIMEOUT = 10.0
+
+LANE_NAMES = {PRIORITY_DIGEST: 'digest', PRIORITY_REPLY: 'reply', PRIORITY_CHATTER: 'chatter'}
+
+SEND_DURATION = REGISTRY.histogram('discord_send_duration_seconds', 'Discordへの送信にかかった時間')
+SEND_TOTAL = REGISTRY.counter('discord_send_total', 'Discordへの送信数')
+SEND_MERGED = REGISTRY.counter('discord_send_merged_total', '他のメッセージにまとめて送った数')
+
+
+def split_message(text, limit=DISCORD_MESSAGE_LIMIT):
+    """文字数上限を超える本文を行単位で分割"""
+    chunks = []
+    current = ''
+    for line in text.split('\n'):
+        # 1行だけで上限を超える場合はその行を切り詰めて分割
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ''
+            chunks.append(line[:limit])
+            line = line[limit:]
+        candidate = f'{current}\n{line}' if current else line
+        if len(candidate) > limit:
+            chunks.append(current)
+            current = line
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class _Outgoing:
+    """送信待ちのメッセージ1通"""
+
+    __slots__ = ('content', 'file', 'futures')
+
+    def __init__(self, content, file, future):
+        self.content = content
+        self.file = file
+        self.futures = [future]
+
+
+class _ChannelLane:
+    """チャンネル毎の送信待ち行列と送信履歴"""
+
+    __slots__ = ('channel', 'heap', 'sent_at', 'worker')
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.heap = []          # [(priority, seq, _Outgoing)]
+        self.sent_at = deque()  # 直近の送信時刻
+        self.worker = None
+
+
+class OutboundDispatcher:
+    """チャンネル毎に優先度付きで送信するディスパッチャー"""
+
+    def __init__(self, rate_limit=CHANNEL_RATE_LIMIT, rate_period=CHANNEL_RATE_PERIOD):
+        self.rate_limit = rate_limit
+        self.rate_period = rate_period
+        self._lanes = {}  # {channel_id: _ChannelLane}
+        self._seq = itertools.count()
+
+    def send(self, channel, content=None, *, file=None, priority=PRIORITY_REPLY):
+        """メッセージを送信待ちに積む
+
+        戻り値の Future は最後の1通を送り終えると送信した discord.Message に
+        なる（失敗時は None）。完了を待つ必要がなければ await しなくてよい。
+        """
+        loop = asyncio.get_running_loop()
+        if not content and file is None:
+            # 空のメッセージは送れないので何もしない
+            future = loop.create_future()
+            future.set_result(None)
+            return future
+
+        lane = self._lanes.get(channel.id)
+        if lane is None:
+            lane = self._lanes[channel.id] = _ChannelLane(channel)
+
+        chunks = split_message(content) if content else [None]
+        future = None
+        for i, chunk in enumerate(chunks):
+            future = loop.create_future()
+            # 添付ファイルは最後の1通に付ける
+            item = _Outgoing(chunk, file if i == len(chunks) - 1 else None, future)
+            heapq.heappush(lane.heap, (priority, next(self._seq), item))
+
+        if lane.worker is None or lane.worker.done():
+            lane.worker = asyncio.create_task(self._drain(lane))
+        return future
+
+    async def _drain(self, lane):
+        while lane.heap:
+            await self._wait_for_slot(lane)
+            priority, _, item = heapq.heappop(lane.heap)
+            self._merge_pending(lane, priority, item)
+
+            lane_name = LANE_NAMES.get(priority, str(priority))
+            try:
+                with SEND_DURATION.time(lane=lane_name):
+                    sent = await lane.channel.send(item.content, file=item.file)
+                SEND_TOTAL.inc(lane=lane_name, result='ok')
+            except Exception as e:
+                logger.error('メッセージ送信エラー (チャンネルID: %s): %s', lane.channel.id, e)
+                SEND_TOTAL.inc(lane=lane_name, result='error')
+                sent = None
+            lane.sent_at.append(asyncio.get_running_loop().time())
+
+            for future in item.futures:
+                if not future.done():
+                    future.set_result(sent)
+
+    def _merge_pending(self, lane, priority, item):
+        """同じレーンで待っている短いメッセージを1通にまとめる"""
+        if item.file is not None or item.content is None:
+            return
+        while lane.heap:
+            next_priority, _, candidate = lane.heap[0]
+            if next_priority != priority or candidate.file is not None or candidate.content is None:
+                return
+            merged = f'{item.content}\n{candidate.content}'
+            if len(merged) > DISCORD_MESSAGE_LIMIT:
+                return
+            heapq.heappop(lane.heap)
+            SEND_MERGED.inc()
+            item.content = merged
+            item.futures.extend(candidate.futures)
+
+    async def _wait_for_slot(self, lane):
+        """直近 rate_period 秒の送信数が上限に達していれば空くまで待つ"""
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            while lane.sent_at and now - lane.sent_at[0] >= self.rate_period:
+                lane.sent_at.popleft()
+            if len(lane.sent_at) < self.rate_limit:
+                return
+            await asyncio.sleep(self.rate_period - (now - lane.sent_at[0]))
+
+    async def close(self):
+        """残りの送信を待ってから終了（DRAIN_TIMEOUT 秒で打ち切り）"""
+        workers = [lane.worker for lane in self._lanes.values() if lane.worker is not None]
+        if not workers:
+            return
+        _, pending = await asyncio.wait(workers, timeout=DRAIN_TIMEOUT)
+        for worker in pending:
+            worker.cancel()
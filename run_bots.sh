@@ -0,0 +1,7 @@
+#!/bin/bash
+echo "🚀 ニュースBot + ObsidianBot起動中..."
+cd "$(dirname "$0")"
+source venv/bin/activate
+pip install -r requirements_news.txt
+echo "📰📝 単一プロセスで開始 (BOT_FEATURES=${BOT_FEATURES:-news,obsidian})"
+python3 bot_main.py
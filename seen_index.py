@@ -0,0 +1,273 @@
+"""配信済み記事のインデックス
+
+配信した記事を SQLite に記録し、ソースをまたいだ重複や再起動後の再配信を防ぐ。
+記事は次の2つのキーで照合する。
+
+- 正規化したURL（トラッキング用パラメータを除去し、Googleのリダイレクトを展開）
+- タイトルの SimHash（表記ゆれ程度の違いなら同じ記事とみなす）
+
+SimHash は16ビットずつ4つの帯に分けてそれぞれ索引を張るので、ハミング距離3以内の
+候補は索引検索だけで見つかる。記事数が数十万件に増えても照合は索引1〜4回で済む。
+
+記録は範囲（scope）毎に独立しており、あるギルドへの配信が他のギルドの配信を
+妨げることはない。
+"""
+import base64
+import hashlib
+import re
+import sqlite3
+import time
+import unicodedata
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# 記録を保持する期間（日）
+SEEN_INDEX_MAX_AGE_DAYS = 7
+
+# 期限切れの記録を削除する間隔（秒）
+SEEN_INDEX_PURGE_INTERVAL = 3600
+
+# タイトルを同じ記事とみなすハミング距離の上限（SIMHASH_BANDS 未満であること）
+TITLE_MAX_DISTANCE = 3
+SIMHASH_BANDS = 4
+SIMHASH_BAND_BITS = 16
+
+# 配信済みの記録は範囲（scope、ニュースBotではギルドID）毎に分ける
+DEFAULT_SCOPE = 0
+SEEN_INDEX_SCHEMA_VERSION = 2
+
+# 短すぎるタイトルは誤判定しやすいのでURLのみで照合する
+TITLE_MIN_LENGTH = 8
+
+# 除去するトラッキング用パラメータ（広告・メール配信のクリックID）。
+# source や ref のような一般的な名前は記事を区別していることがあるので、ここには入れない
+TRACKING_PARAMS = frozenset({
+    'fbclid', 'gclid', 'yclid', 'dclid', 'msclkid', 'mc_cid', 'mc_eid',
+})
+TRACKING_PARAM_PREFIXES = ('utm_',)
+# ホスト毎に追加で除去するパラメータ（www. を除いたホスト名）
+HOST_TRACKING_PARAMS = {
+    'news.yahoo.co.jp': frozenset({'source'}),   # RSS からのリンクに付く ?source=rss
+    'news.google.com': frozenset({'oc'}),        # 記事リンクに付く ?oc=5
+}
+
+GOOGLE_REDIRECT_HOSTS = frozenset({'google.com', 'google.co.jp'})
+GOOGLE_NEWS_HOST = 'news.google.com'
+
+TITLE_SOURCE_SUFFIX_RE = re.compile(r'\s+[-－|｜]\s+[^-－|｜]+$')
+NON_WORD_RE = re.compile(r'[\W_]+')
+EMBEDDED_URL_RE = re.compile(rb'https?://[\x21-\x7e]+')
+
+
+def normalize_url(url):
+    """重複判定用にURLを正規化"""
+    url = url.strip()
+    parts = urlsplit(url)
+    host = parts.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+
+    # Googleのリダイレクトリンクは転送先を使う
+    if host in GOOGLE_REDIRECT_HOSTS and parts.path == '/url':
+        query = dict(parse_qsl(parts.query))
+        target = query.get('url') or query.get('q')
+        if target:
+            return normalize_url(target)
+    if host == GOOGLE_NEWS_HOST and '/articles/' in parts.path:
+        target = _decode_google_news_article(parts.path.rsplit('/', 1)[-1])
+        if target:
+            return normalize_url(target)
+
+    host_params = HOST_TRACKING_PARAMS.get(host, frozenset())
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS
+        and key.lower() not in host_params
+        and not key.lower().startswith(TRACKING_PARAM_PREFIXES)
+    )
+    path = parts.path.rstrip('/') or '/'
+    # http/https の違いとフラグメントは無視する
+    return urlunsplit(('', host, path, urlencode(query), ''))
+
+
+def _decode_google_news_article(article_id):
+    """Google Newsの記事IDに埋め込まれた元記事のURLを取り出す（旧形式のみ）"""
+    try:
+        data = base64.urlsafe_b64decode(article_id + '=' * (-len(article_id) % 4))
+    except (ValueError, TypeError):
+        return None
+    match = EMBEDDED_URL_RE.search(data)
+    return match.group().decode('ascii') if match else None
+
+
+def normalize_title(title):
+    """表記ゆれを吸収したタイトル（末尾の「 - 媒体名」や記号を除去）"""
+    title = unicodedata.normalize('NFKC', title).lower()
+    title = TITLE_SOURCE_SUFFIX_RE.sub('', title)
+    return NON_WORD_RE.sub('', title)
+
+
+def title_fingerprint(title):
+    """正規化したタイトルの文字バイグラムから64ビットの SimHash を計算"""
+    text = normalize_title(title)
+    if len(text) < TITLE_MIN_LENGTH:
+        return None
+
+    # 各バイグラムのハッシュをビット列にし、桁毎に 1 が過半数なら 1 とする
+    bits = [format(_hash64(text[i:i + 2]), '064b') for i in range(len(text) - 1)]
+    half = len(bits) / 2
+    fingerprint = 0
+    for position, column in enumerate(zip(*bits)):
+        if column.count('1') > half:
+            fingerprint |= 1 << (63 - position)
+    return fingerprint
+
+
+def _hash64(text):
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def _to_signed(value):
+    """SQLiteの INTEGER に収まるよう符号付き64ビットに変換"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _bands(fingerprint):
+    mask = (1 << SIMHASH_BAND_BITS) - 1
+    return [fingerprint >> (i * SIMHASH_BAND_BITS) & mask for i in range(SIMHASH_BANDS)]
+
+
+class SeenIndex:
+    """配信済み記事の永続インデックス
+
+    `open()` で接続し、終了時に `close()` を呼ぶ。
+    """
+
+    def __init__(self, path, max_age_days=SEEN_INDEX_MAX_AGE_DAYS):
+        self.path = path
+        self.max_age = max_age_days * 86400
+        self._conn = None
+        self._last_purge = 0.0
+
+    def open(self):
+        if self._conn is not None:
+            return
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        version = self._conn.execute('PRAGMA user_version').fetchone()[0]
+        if version < SEEN_INDEX_SCHEMA_VERSION:
+            # 範囲（scope）のない旧形式は作り直す（再配信は最大1回で済む）
+            self._conn.executescript('''
+                DROP TABLE IF EXISTS seen_urls;
+                DROP TABLE IF EXISTS seen_titles;
+            ''')
+        self._conn.executescript(f'''
+            CREATE TABLE IF NOT EXISTS seen_urls (
+                scope INTEGER NOT NULL,
+                url_hash INTEGER NOT NULL,
+                seen_at REAL NOT NULL,
+                PRIMARY KEY (scope, url_hash)
+            );
+            CREATE INDEX IF NOT EXISTS idx_seen_urls_seen_at ON seen_urls (seen_at);
+
+            CREATE TABLE IF NOT EXISTS seen_titles (
+                scope INTEGER NOT NULL,
+                fingerprint INTEGER NOT NULL,
+                band0 INTEGER NOT NULL,
+                band1 INTEGER NOT NULL,
+                band2 INTEGER NOT NULL,
+                band3 INTEGER NOT NULL,
+                seen_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_seen_titles_band0 ON seen_titles (scope, band0);
+            CREATE INDEX IF NOT EXISTS idx_seen_titles_band1 ON seen_titles (scope, band1);
+            CREATE INDEX IF NOT EXISTS idx_seen_titles_band2 ON seen_titles (scope, band2);
+            CREATE INDEX IF NOT EXISTS idx_seen_titles_band3 ON seen_titles (scope, band3);
+            CREATE INDEX IF NOT EXISTS idx_seen_titles_seen_at ON seen_titles (seen_at);
+            PRAGMA user_version = {SEEN_INDEX_SCHEMA_VERSION};
+        ''')
+        self.purge_expired()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def is_seen(self, item, scope=DEFAULT_SCOPE):
+        """記事が scope で配信済みかどうか（URLまたはタイトルが一致すれば配信済み）"""
+        cutoff = time.time() - self.max_age
+        if item.link:
+            row = self._conn.execute(
+                'SELECT 1 FROM seen_urls WHERE scope = ? AND url_hash = ? AND seen_at >= ?',
+                (scope, _url_hash(item.link), cutoff),
+            ).fetchone()
+            if row:
+                return True
+
+        fingerprint = title_fingerprint(item.title)
+        if fingerprint is None:
+            return False
+        b0, b1, b2, b3 = _bands(fingerprint)
+        rows = self._conn.execute(
+            _TITLE_CANDIDATES_SQL,
+            (scope, b0, cutoff, scope, b1, cutoff, scope, b2, cutoff, scope, b3, cutoff),
+        )
+        for (candidate,) in rows:
+            if bin((candidate & ((1 << 64) - 1)) ^ fingerprint).count('1') <= TITLE_MAX_DISTANCE:
+                return True
+        return False
+
+    def mark_seen(self, items, scope=DEFAULT_SCOPE):
+        """記事を scope で配信済みとして記録"""
+        now = time.time()
+        url_rows = []
+        title_rows = []
+        for item in items:
+            if item.link:
+                url_rows.append((scope, _url_hash(item.link), now))
+            fingerprint = title_fingerprint(item.title)
+            if fingerprint is not None:
+                title_rows.append((scope, _to_signed(fingerprint), *_bands(fingerprint), now))
+
+        with self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO seen_urls (scope, url_hash, seen_at) VALUES (?, ?, ?)', url_rows
+            )
+            self._conn.executemany(
+                'INSERT INTO seen_titles (scope, fingerprint, band0, band1, band2, band3, seen_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                title_rows,
+            )
+
+        if now - self._last_purge > SEEN_INDEX_PURGE_INTERVAL:
+            self.purge_expired()
+
+    def filter_unseen(self, items, limit=None, scope=DEFAULT_SCOPE):
+        """scope で未配信の記事を先頭から最大 limit 件返す"""
+        unseen = []
+        for item in items:
+            if limit is not None and len(unseen) >= limit:
+                break
+            if not self.is_seen(item, scope):
+                unseen.append(item)
+        return unseen
+
+    def purge_expired(self):
+        """保持期間を過ぎた記録を削除"""
+        now = time.time()
+        cutoff = now - self.max_age
+        with self._conn:
+            self._conn.execute('DELETE FROM seen_urls WHERE seen_at < ?', (cutoff,))
+            self._conn.execute('DELETE FROM seen_titles WHERE seen_at < ?', (cutoff,))
+        self._last_purge = now
+
+
+# 帯毎に索引 (scope, bandN) を使わせるため OR ではなく UNION ALL で書く
+_TITLE_CANDIDATES_SQL = ' UNION ALL '.join(
+    f'SELECT fingerprint FROM seen_titles WHERE scope = ? AND band{i} = ? AND seen_at >= ?'
+    for i in range(SIMHASH_BANDS)
+)
+
+
+def _url_hash(url):
+    return _to_signed(_hash64(normalize_url(url)))
@@ -0,0 +1,139 @@
+"""ObsidianBotのノートをVault（フォルダ）に直接書き出す
+
+`YYYY-MM-DD.md` を指定したフォルダ（同期しているマウントでもよい）に書く。
+
+- 新しいメッセージは溜めておき、flush() のたびに日毎に1回の追記と fsync で書く
+- 編集・削除や、古いメッセージが後から来た日はファイル全体を作り直す。一時ファイルに
+  書いて fsync してから置き換える（rename）ので、途中の状態のファイルは見えない
+- このプロセスで初めて書く日は、ファイルの中身が分からないので作り直しから始める
+- ファイルへの書き込みはワーカースレッドで行う（イベントループを止めない）
+"""
+import asyncio
+import logging
+import os
+import tempfile
+
+from message_store import message_sort_key
+
+logger = logging.getLogger(__name__)
+
+
+class VaultSink:
+    """日毎のノートファイルへの追記・作り直しをまとめて行う
+
+    flush() には2つの関数を渡す。
+    - render_day(date_str) -> (ファイル全体のバイト列, 最後のメッセージの並び順)
+    - render_line(message) -> 1件分の行（str）
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._appends = {}      # {date_str: [StoredMessage]} 次の flush で追記する分
+        self._rewrites = set()  # 次の flush で作り直す日
+        self._synced = set()    # ファイルの中身が分かっている（このプロセスで作り直した）日
+        self._last_keys = {}    # {date_str: ファイルの末尾のメッセージの並び順}
+        self._lock = asyncio.Lock()
+
+    def path(self, date_str):
+        return os.path.join(self.directory, f'{date_str}.md')
+
+    def append(self, date_str, message):
+        """メッセージ1件を追記の対象にする（末尾に来ない場合は作り直す）"""
+        if date_str in self._rewrites:
+            return
+        key = message_sort_key(message)
+        last_key = self._last_keys.get(date_str)
+        if last_key is not None and key < last_key:
+            self.rewrite(date_str)
+            return
+        self._last_keys[date_str] = key
+        self._appends.setdefault(date_str, []).append(message)
+
+    def rewrite(self, date_str):
+        """次の flush でその日のファイルを作り直す"""
+        self._rewrites.add(date_str)
+        self._appends.pop(date_str, None)
+
+    async def flush(self, render_day, render_line):
+        """溜まっている追記・作り直しを書き出す"""
+        async with self._lock:
+            appends, self._appends = self._appends, {}
+            rewrites, self._rewrites = self._rewrites, set()
+            rewrites |= appends.keys() - self._synced
+
+            jobs = []
+            for date_str in sorted(rewrites):
+                data, last_key = render_day(date_str)
+                self._last_keys[date_str] = last_key
+                jobs.append((date_str, data, True))
+            for date_str, messages in sorted(appends.items()):
+                if date_str in rewrites:
+                    continue
+                # 追記を待つ間に削除されたもの（content が None）は書かない
+                data = ''.join(render_line(message) for message in messages if message.content is not None)
+                if data:
+                    jobs.append((date_str, data.encode('utf-8'), False))
+            if not jobs:
+                return
+
+            try:
+                missing = await asyncio.to_thread(self._write, jobs)
+            except OSError as e:
+                logger.error('Vaultへの書き込みに失敗しました (%s): %s', self.directory, e)
+                # 途中まで書けている可能性があるので、次回は作り直す
+                for date_str, _, _ in jobs:
+                    self._synced.discard(date_str)
+                    self._rewrites.add(date_str)
+                return
+            self._synced.update(date_str for date_str, _, rewrite in jobs if rewrite)
+            for date_str in missing:
+                self._synced.discard(date_str)
+                self._rewrites.add(date_str)
+
+    def _write(self, jobs):
+        """ワーカースレッドで書き込む。追記先のファイルがなかった日の一覧を返す"""
+        os.makedirs(self.directory, exist_ok=True)
+        missing = []
+        replaced = False
+        for date_str, data, rewrite in jobs:
+            path = self.path(date_str)
+            if rewrite:
+                self._replace(path, data)
+                replaced = True
+            elif not os.path.exists(path):
+                # Vault側で削除・移動された。次の flush で作り直す
+                missing.append(date_str)
+            else:
+                with open(path, 'ab') as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+        if replaced:
+            self._fsync_directory()
+        return missing
+
+    def _replace(self, path, data):
+        # Obsidianや同期ツールが拾わないよう、一時ファイルは隠しファイルにする
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except OSError:
+            os.unlink(tmp_path)
+            raise
+
+    def _fsync_directory(self):
+        # 置き換え（rename）自体を永続化する。ディレクトリを開けない環境では省略する
+        try:
+            fd = os.open(self.directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)